@@ -0,0 +1,73 @@
+import java.io.*;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.Charset;
+import java.nio.file.Files;
+import java.nio.file.Path;
+
+/**
+ * Keeps one JVM running a dependency converter over many batches of trees.
+ *
+ *   java -cp "./*:." ConverterServer edu.stanford.nlp.trees.EnglishGrammaticalStructure \
+ *       -treeFile {trees} -basic -makeCopulaHead -conllx
+ *
+ * Requests on stdin are a line holding the byte length of the trees,
+ * then the trees. For each one the converter's main() is called with
+ * {trees} replaced by a file holding them, and what it prints is
+ * returned on stdout as "OK <length>\n<output>". A converter exception
+ * gives "ERR <length>\n<message>" and the server carries on.
+ *
+ * Uses reflection only, so it compiles without CoreNLP on the classpath.
+ */
+public class ConverterServer {
+    public static void main(String[] args) throws Exception {
+        Method convert = Class.forName(args[0]).getMethod("main", String[].class);
+        Path treeFile = Files.createTempFile("converter", ".mrg");
+        treeFile.toFile().deleteOnExit();
+        String[] convertArgs = new String[args.length - 1];
+        for (int i = 1; i < args.length; i++) {
+            convertArgs[i - 1] = args[i].replace("{trees}", treeFile.toString());
+        }
+        DataInputStream in = new DataInputStream(new BufferedInputStream(System.in));
+        // The converters print to System.out, so replies go straight to the
+        // file descriptor and System.out is pointed at a buffer per request
+        OutputStream out = new BufferedOutputStream(new FileOutputStream(FileDescriptor.out));
+        PrintStream stdout = System.out;
+        String encoding = Charset.defaultCharset().name();
+        String header;
+        while ((header = readLine(in)) != null) {
+            byte[] trees = new byte[Integer.parseInt(header.trim())];
+            in.readFully(trees);
+            Files.write(treeFile, trees);
+            ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+            String status = "OK";
+            byte[] reply;
+            System.setOut(new PrintStream(buffer, true, encoding));
+            try {
+                convert.invoke(null, (Object) convertArgs.clone());
+                System.out.flush();
+                reply = buffer.toByteArray();
+            } catch (InvocationTargetException e) {
+                status = "ERR";
+                reply = e.getCause().toString().getBytes(encoding);
+            } finally {
+                System.setOut(stdout);
+            }
+            out.write((status + " " + reply.length + "\n").getBytes("US-ASCII"));
+            out.write(reply);
+            out.flush();
+        }
+    }
+
+    private static String readLine(DataInputStream in) throws IOException {
+        StringBuilder line = new StringBuilder();
+        int c;
+        while ((c = in.read()) != '\n') {
+            if (c == -1) {
+                return line.length() == 0 ? null : line.toString();
+            }
+            line.append((char) c);
+        }
+        return line.toString();
+    }
+}
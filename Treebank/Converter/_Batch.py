@@ -0,0 +1,45 @@
+"""
+Converting the trees of many files in one converter call
+
+The converter prints one block of lines per tree, each followed by a
+blank line, so the output for several files' trees can be cut back into
+per-file texts by counting blocks. The count has to come out exactly,
+or the sentences would be matched to the wrong trees.
+"""
+from _ConverterPool import ConverterError
+
+
+def splitSentences(text):
+    """
+    The sentence blocks of converter output, each with its blank line
+    """
+    text = text.strip()
+    if not text:
+        return []
+    return [block + '\n\n' for block in text.split('\n\n')]
+
+
+def splitByCounts(text, counts):
+    """
+    Cut converter output into consecutive texts of counts[i] sentences
+    """
+    sentences = splitSentences(text)
+    if len(sentences) != sum(counts):
+        raise ConverterError('Converter gave %d sentences for %d trees' %
+                             (len(sentences), sum(counts)))
+    texts = []
+    start = 0
+    for count in counts:
+        texts.append(u''.join(sentences[start:start + count]))
+        start += count
+    return texts
+
+
+def convertGroups(groups, convert):
+    """
+    Convert several lists of trees with one call to convert(trees), and
+    return the output for each list
+    """
+    groups = [list(trees) for trees in groups]
+    output = convert([tree for trees in groups for tree in trees])
+    return splitByCounts(output, [len(trees) for trees in groups])
@@ -0,0 +1,163 @@
+"""
+Per-file outputs of a conversion run, for resuming and rebuilding
+
+A BuildManifest keeps each input file's finished output as a chunk in
+<directory>/chunks, and lists them in <directory>/manifest.tsv with the
+digest of the input and the fingerprint of the run that built them, as
+(key, digest, fingerprint, chunk) rows. A rerun only processes the files
+that are new, changed, or were built by a different converter or script,
+and reuses the rest. Chunks are written then renamed, and their rows
+appended as each one is finished, so a run that dies keeps everything it
+finished. Output files are put together with atomicOpen(), so they are
+either the old ones or complete new ones.
+"""
+import hashlib
+import io
+import marshal
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+# mkstemp makes files only their owner can read
+_FILE_MODE = 0666 & ~_umask()
+
+
+def fileDigest(*paths):
+    """
+    SHA-1 of the contents of the files
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as file_:
+            for block in iter(lambda: file_.read(1 << 20), ''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def atomicOpen(location, mode='w'):
+    """
+    Open a temp file beside location for writing, and rename it to
+    location once the block finishes without an exception
+    """
+    directory = os.path.dirname(str(location)) or '.'
+    handle, tmpLocation = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(handle)
+    try:
+        with io.open(tmpLocation, mode) as file_:
+            yield file_
+        os.chmod(tmpLocation, _FILE_MODE)
+        os.rename(tmpLocation, str(location))
+    except:
+        os.remove(tmpLocation)
+        raise
+
+
+class BuildManifest(object):
+    def __init__(self, directory, fingerprint):
+        self.directory = directory
+        self.fingerprint = hashlib.sha1(fingerprint).hexdigest()
+        self.reused = 0
+        self.built = 0
+        self._chunkDir = os.path.join(directory, 'chunks')
+        if not os.path.isdir(self._chunkDir):
+            os.makedirs(self._chunkDir)
+        self._location = os.path.join(directory, 'manifest.tsv')
+        self._rows = {}
+        if os.path.exists(self._location):
+            with open(self._location) as file_:
+                for line in file_:
+                    fields = line.rstrip('\n').split('\t')
+                    # A run that died may have left half a row
+                    if len(fields) == 4 and line.endswith('\n'):
+                        self._rows[fields[0]] = tuple(fields[1:])
+        self._log = open(self._location, 'a')
+
+    def isFresh(self, key, digest):
+        """
+        Whether there's a chunk built for key from an input with this
+        digest, by a run with this fingerprint
+        """
+        row = self._rows.get(key)
+        return (row is not None and row[:2] == (digest, self.fingerprint) and
+                os.path.exists(os.path.join(self._chunkDir, row[2])))
+
+    def chunk(self, key, digest):
+        """
+        The output built for key from an input with this digest, by a run
+        with this fingerprint, or None
+        """
+        if not self.isFresh(key, digest):
+            return None
+        row = self._rows[key]
+        try:
+            with open(os.path.join(self._chunkDir, row[2]), 'rb') as file_:
+                return marshal.load(file_)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+    def store(self, key, digest, output):
+        """
+        Save key's output, which marshal must be able to write
+        """
+        name = '%s.chunk' % hashlib.sha1('%s\t%s\t%s' % (key, digest, self.fingerprint)).hexdigest()
+        with atomicOpen(os.path.join(self._chunkDir, name), 'wb') as file_:
+            file_.write(marshal.dumps(output, 2))
+        self._rows[key] = (digest, self.fingerprint, name)
+        self._log.write('%s\t%s\t%s\t%s\n' % (key, digest, self.fingerprint, name))
+        self._log.flush()
+
+    def results(self, items, key, digest, process):
+        """
+        Generate the output for each of the items in order, from its chunk
+        if there is one for key(item) and digest(item), both strings, and
+        otherwise from process(), which is called now with the list of
+        items that have none, and must generate their outputs in order.
+        New outputs are stored as they come, and chunks are only loaded
+        when their turn comes
+        """
+        items = list(items)
+        keys = [key(item) for item in items]
+        digests = [digest(item) for item in items]
+        fresh = [self.isFresh(k, d) for k, d in zip(keys, digests)]
+        built = iter(process([item for item, isFresh in zip(items, fresh) if not isFresh]))
+        return self._merge(keys, digests, fresh, built)
+
+    def _merge(self, keys, digests, fresh, built):
+        for k, d, isFresh in zip(keys, digests, fresh):
+            if isFresh:
+                chunk = self.chunk(k, d)
+                if chunk is None:
+                    raise ValueError('Unreadable chunk for %s' % k)
+                self.reused += 1
+            else:
+                chunk = next(built, None)
+                if chunk is None:
+                    raise ValueError('No output for %s' % k)
+                self.store(k, d, chunk)
+                self.built += 1
+            yield chunk
+
+    def report(self):
+        return '%d files, %d reused from the build manifest, %d built' % (
+            self.reused + self.built, self.reused, self.built)
+
+    def close(self):
+        """
+        Rewrite the manifest without superseded rows, and delete the
+        chunks no row refers to
+        """
+        self._log.close()
+        with atomicOpen(self._location, 'wb') as file_:
+            for k, (d, fingerprint, name) in sorted(self._rows.items()):
+                file_.write('%s\t%s\t%s\t%s\n' % (k, d, fingerprint, name))
+        used = set(name for d, fingerprint, name in self._rows.values())
+        for name in os.listdir(self._chunkDir):
+            if name not in used:
+                os.remove(os.path.join(self._chunkDir, name))
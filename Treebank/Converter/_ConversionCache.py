@@ -0,0 +1,97 @@
+"""
+Persistent memo of converter output, one entry per tree
+
+Switchboard repeats a lot of trees ("uh-huh", "yeah"...), and reruns
+convert the same trees again. A ConversionCache keeps the converter's
+output for each tree in an SQLite file, keyed on a hash of the
+converter's fingerprint and the tree, so only trees it hasn't seen go
+to the converter, each of them once.
+"""
+import hashlib
+import os
+import sqlite3
+
+from _Batch import splitSentences
+from _ConverterPool import ConverterError
+
+
+def converterFingerprint(converterArgs, converterDir):
+    """
+    Identifies what a converter outputs: its arguments, and the names and
+    sizes of the jars it runs from
+    """
+    jars = sorted((name, os.path.getsize(os.path.join(converterDir, name)))
+                  for name in os.listdir(converterDir) if name.endswith('.jar'))
+    return repr((list(converterArgs), jars))
+
+
+class ConversionCache(object):
+    def __init__(self, location, converterID):
+        self.location = location
+        self.converterID = converterID
+        self.requested = 0
+        self.converted = 0
+        # A pipeline's conversion stage uses the cache from its own thread,
+        # though never from two at once
+        self._db = sqlite3.connect(location, timeout=60, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS conversions '
+                         '(key TEXT PRIMARY KEY, output TEXT)')
+
+    def _key(self, tree):
+        # Whitespace doesn't change the parse, so it doesn't change the key
+        text = u' '.join(tree.split())
+        if isinstance(text, unicode):
+            text = text.encode('utf8')
+        return hashlib.sha1('%s\n%s' % (self.converterID, text)).hexdigest()
+
+    def convert(self, trees, convert):
+        """
+        Output for the trees, as convert(trees) would give it, calling
+        convert() once, with the trees not in the cache
+        """
+        trees = list(trees)
+        keys = [self._key(tree) for tree in trees]
+        outputs = self._lookup(set(keys))
+        misses = []
+        missKeys = []
+        for key, tree in zip(keys, trees):
+            if key not in outputs:
+                # Placeholder, so a repeated tree goes to the converter once
+                outputs[key] = None
+                misses.append(tree)
+                missKeys.append(key)
+        if misses:
+            converted = splitSentences(convert(misses))
+            if len(converted) != len(misses):
+                raise ConverterError('Converter gave %d sentences for %d trees' %
+                                     (len(converted), len(misses)))
+            outputs.update(zip(missKeys, converted))
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO conversions VALUES (?, ?)',
+                                     zip(missKeys, converted))
+        self.requested += len(trees)
+        self.converted += len(misses)
+        return u''.join(outputs[key] for key in keys)
+
+    def _lookup(self, keys):
+        outputs = {}
+        keys = list(keys)
+        # SQLite limits the number of parameters in a query
+        for start in xrange(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            query = 'SELECT key, output FROM conversions WHERE key IN (%s)' % \
+                    ','.join('?' * len(chunk))
+            outputs.update(self._db.execute(query, chunk))
+        return outputs
+
+    def hitRate(self):
+        if not self.requested:
+            return 0.0
+        return float(self.requested - self.converted) / self.requested
+
+    def report(self):
+        return '%d trees, %d from the conversion cache (%.1f%%), %d converted' % (
+            self.requested, self.requested - self.converted, self.hitRate() * 100, self.converted)
+
+    def close(self):
+        self._db.close()
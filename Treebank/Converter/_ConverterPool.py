@@ -0,0 +1,244 @@
+"""
+Long-running dependency converter processes
+
+Starting a JVM for every file costs more than converting it. A
+ConverterPool keeps a number of converter processes running, either
+ConverterServer.java around a Stanford converter or the Python stand-in,
+and sends them trees over their stdin and stdout.
+
+A request is a line holding the byte length of the trees, then the
+trees; the reply is "OK <length>\\n<output>" or "ERR <length>\\n<message>".
+Each convert() call is cut into batches of at most batchTokens words,
+and no more than an even share of the call's words, so that one file's
+trees keep every worker busy. A worker that dies or takes longer than
+timeout seconds on a batch is killed and restarted, and the batch is
+tried again.
+"""
+import errno
+import fcntl
+import os
+import re
+import select
+import subprocess
+import sys
+import threading
+import time
+import Queue
+
+# Converter arguments for ConverterServer. {trees} is the file the
+# server writes each batch of trees to
+STANFORD_BASIC = ['edu.stanford.nlp.trees.EnglishGrammaticalStructure', '-treeFile', '{trees}',
+                  '-basic', '-makeCopulaHead', '-conllx']
+UNIVERSAL = ['edu.stanford.nlp.trees.ud.UniversalDependenciesConverter', '-encoding', 'UTF-8',
+             '-treeFile', '{trees}']
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_leafRE = re.compile(r'\([^\s()]+ [^\s()]+\)')
+
+
+class ConverterError(Exception):
+    pass
+
+
+class _WorkerFailure(Exception):
+    """The process died or timed out, so a restart may help"""
+
+
+def javaCommand(converterArgs, converterDir, javaOptions=()):
+    """
+    Command for a ConverterServer running the converter, to be run from
+    converterDir, which holds the CoreNLP jars. Compiles the server into
+    converterDir if it isn't there or is out of date
+    """
+    source = os.path.join(_here, 'ConverterServer.java')
+    classFile = os.path.join(converterDir, 'ConverterServer.class')
+    if not os.path.exists(classFile) or os.path.getmtime(classFile) < os.path.getmtime(source):
+        subprocess.check_call(['javac', '-d', converterDir, source])
+    return ['java'] + list(javaOptions) + ['-cp', './*:.', 'ConverterServer'] + list(converterArgs)
+
+
+def standInCommand(*args):
+    """
+    Command for the Python stand-in converter
+    """
+    return [sys.executable, os.path.join(_here, '_StandIn.py')] + list(args)
+
+
+def countTokens(tree):
+    return max(1, len(_leafRE.findall(tree)))
+
+
+def makeBatches(trees, maxTokens):
+    """
+    Cut trees into consecutive batches of at most maxTokens words,
+    except where a single tree is longer
+    """
+    batches = []
+    batch = []
+    size = 0
+    for tree in trees:
+        tokens = countTokens(tree)
+        if batch and size + tokens > maxTokens:
+            batches.append(batch)
+            batch = []
+            size = 0
+        batch.append(tree)
+        size += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class _Worker(object):
+    def __init__(self, command, cwd):
+        self.command = command
+        self.cwd = cwd
+        self.process = None
+        self._buffer = ''
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, bufsize=0,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._buffer = ''
+        # Writes mustn't block, so a converter that stops reading times out
+        fd = self.process.stdin.fileno()
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process.wait()
+        self.process = None
+
+    def request(self, payload, timeout):
+        if self.process is None or self.process.poll() is not None:
+            self.stop()
+            self.start()
+        deadline = time.time() + timeout if timeout else None
+        self._write('%d\n%s' % (len(payload), payload), deadline)
+        while '\n' not in self._buffer:
+            self._fill(deadline)
+        header, self._buffer = self._buffer.split('\n', 1)
+        status, length = header.split()
+        length = int(length)
+        while len(self._buffer) < length:
+            self._fill(deadline)
+        reply = self._buffer[:length]
+        self._buffer = self._buffer[length:]
+        if status != 'OK':
+            raise ConverterError(reply)
+        return reply
+
+    def _write(self, data, deadline):
+        fd = self.process.stdin.fileno()
+        while data:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and (remaining <= 0 or
+                                          not select.select([], [fd], [], remaining)[1]):
+                raise _WorkerFailure('converter timed out')
+            elif remaining is None:
+                select.select([], [fd], [])
+            try:
+                data = data[os.write(fd, data[:65536]):]
+            except OSError, e:
+                if e.errno != errno.EAGAIN:
+                    raise _WorkerFailure('converter exited (%s)' % e)
+
+    def _fill(self, deadline):
+        fd = self.process.stdout.fileno()
+        if deadline is None:
+            remaining = None
+        else:
+            remaining = deadline - time.time()
+        if remaining is not None and (remaining <= 0 or not select.select([fd], [], [], remaining)[0]):
+            raise _WorkerFailure('converter timed out')
+        data = os.read(fd, 65536)
+        if not data:
+            raise _WorkerFailure('converter exited with code %s' % self.process.wait())
+        self._buffer += data
+
+
+class ConverterPool(object):
+    """
+    Converter processes that convert lists of bracketed trees. Use as a
+    context manager, or call close() to stop them
+    """
+    def __init__(self, command, workers=1, cwd=None, batchTokens=5000, timeout=600, retries=1):
+        self.batchTokens = batchTokens
+        self.timeout = timeout
+        self.retries = retries
+        self.restarts = 0
+        self._workers = [_Worker(command, cwd) for i in xrange(workers)]
+        self._lock = threading.Lock()
+        # Start them all now, so the JVMs load in parallel
+        for worker in self._workers:
+            worker.start()
+
+    def convert(self, trees):
+        """
+        The converter's output for the trees, in order
+        """
+        trees = list(trees)
+        if not trees:
+            return u''
+        total = sum(countTokens(tree) for tree in trees)
+        share = -(-total // len(self._workers))
+        batches = makeBatches(trees, min(self.batchTokens, share))
+        with self._lock:
+            if len(batches) == 1 or len(self._workers) == 1:
+                return u''.join(self._convertBatch(self._workers[0], batch) for batch in batches)
+            return u''.join(self._convertInParallel(batches))
+
+    def _convertInParallel(self, batches):
+        results = [None] * len(batches)
+        errors = []
+        queue = Queue.Queue()
+        for item in enumerate(batches):
+            queue.put(item)
+
+        def work(worker):
+            while not errors:
+                try:
+                    i, batch = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    results[i] = self._convertBatch(worker, batch)
+                except Exception:
+                    errors.append(sys.exc_info())
+
+        threads = [threading.Thread(target=work, args=(worker,))
+                   for worker in self._workers[:len(batches)]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        return results
+
+    def _convertBatch(self, worker, batch):
+        payload = u'\n'.join(batch)
+        if isinstance(payload, unicode):
+            payload = payload.encode('utf8')
+        for attempt in xrange(self.retries + 1):
+            try:
+                return worker.request(payload, self.timeout).decode('utf8')
+            except _WorkerFailure, failure:
+                worker.stop()
+                self.restarts += 1
+        raise ConverterError('Batch of %d trees failed: %s\n%s' % (len(batch), failure, batch[0]))
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,83 @@
+"""
+One-off converter runs through pipes
+
+The converter reads the trees from /dev/stdin and its output is read
+from stdout as it comes, a sentence at a time, so nothing goes through
+/tmp. Where there's no /dev/stdin the trees go to a temp file with a
+unique name, so concurrent runs can't clobber each other.
+"""
+import os
+import subprocess
+import tempfile
+import threading
+
+from _ConverterPool import ConverterError
+
+
+def iterSentences(stream):
+    """
+    Generate the sentence blocks of converter output from a file object,
+    each with its blank line, as each one is completed
+    """
+    lines = []
+    for line in iter(stream.readline, ''):
+        if line.strip():
+            lines.append(line)
+        elif lines:
+            lines.append('\n')
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines).rstrip('\n') + '\n\n'
+
+
+def streamConverter(command, trees, cwd=None):
+    """
+    Run the command, which names its tree file as {trees}, over the trees
+    and generate the sentences it outputs, decoded from UTF-8
+    """
+    payload = u'\n'.join(trees)
+    if isinstance(payload, unicode):
+        payload = payload.encode('utf8')
+    tmpLocation = None
+    if os.path.exists('/dev/stdin'):
+        treeFile = '/dev/stdin'
+    else:
+        handle, tmpLocation = tempfile.mkstemp(suffix='.mrg')
+        with os.fdopen(handle, 'wb') as file_:
+            file_.write(payload)
+        treeFile = tmpLocation
+    command = [arg.replace('{trees}', treeFile) for arg in command]
+    try:
+        process = subprocess.Popen(command, cwd=cwd, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE)
+        # Write from another thread, so a converter that starts printing
+        # before it has read everything can't fill the pipe and deadlock
+        writer = threading.Thread(target=_write, args=(process.stdin,
+                                                       '' if tmpLocation else payload))
+        writer.start()
+        for sentence in iterSentences(process.stdout):
+            yield sentence.decode('utf8')
+        writer.join()
+        if process.wait() != 0:
+            raise ConverterError('%s exited with code %d' % (command[0], process.returncode))
+    finally:
+        if tmpLocation is not None:
+            os.remove(tmpLocation)
+
+
+def runConverter(command, trees, cwd=None):
+    """
+    All the converter's output for the trees
+    """
+    return u''.join(streamConverter(command, trees, cwd=cwd))
+
+
+def _write(stdin, payload):
+    try:
+        stdin.write(payload)
+    except IOError:
+        # The converter has exited; wait() reports it
+        pass
+    finally:
+        stdin.close()
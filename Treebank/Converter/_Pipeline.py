@@ -0,0 +1,83 @@
+"""
+Streaming stages connected by bounded queues
+
+pipeline() runs the iteration over its items, and each stage, in a
+thread of its own, handing work on through queues that hold at most
+queueSize items. While the converter process works on one item, the
+stages before it can prepare the next ones and the stages after it can
+finish the last ones, and only a few items are ever in flight however
+many there are.
+"""
+import sys
+import threading
+import Queue
+
+_END = object()
+
+
+def pipeline(items, stages, queueSize=2):
+    """
+    Generate stages[-1](...stages[0](item)) for each of the items, in
+    order. An exception in any stage is raised here
+    """
+    queues = [Queue.Queue(queueSize) for i in xrange(len(stages) + 1)]
+    stop = threading.Event()
+
+    def put(queue, message):
+        # Give up once the consumer has gone away
+        while not stop.is_set():
+            try:
+                queue.put(message, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def get(queue):
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Queue.Empty:
+                pass
+        return _END, None
+
+    def feed(outbox):
+        try:
+            for item in items:
+                if not put(outbox, (item, None)):
+                    return
+        except Exception:
+            put(outbox, (_END, sys.exc_info()))
+            return
+        put(outbox, (_END, None))
+
+    def run(stage, inbox, outbox):
+        while True:
+            item, error = get(inbox)
+            if item is _END:
+                put(outbox, (item, error))
+                return
+            try:
+                result = stage(item)
+            except Exception:
+                put(outbox, (_END, sys.exc_info()))
+                return
+            if not put(outbox, (result, None)):
+                return
+
+    threads = [threading.Thread(target=feed, args=(queues[0],))]
+    for i, stage in enumerate(stages):
+        threads.append(threading.Thread(target=run, args=(stage, queues[i], queues[i + 1])))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        while True:
+            item, error = get(queues[-1])
+            if item is _END:
+                if error is not None:
+                    raise error[0], error[1], error[2]
+                return
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,70 @@
+"""
+A stand-in for ConverterServer that needs neither Java nor CoreNLP
+
+Speaks the same protocol, and prints CoNLL-X with each token attached to
+the one before it, so the pool and the scripts can be run and tested
+without the real converter. With a tree file argument it converts that
+once, like a Stanford converter run with -treeFile. A tree with the word
+*CRASH* makes it exit, and one with *HANG* makes it stop responding.
+"""
+import os
+import re
+import sys
+import time
+
+_leafRE = re.compile(r'\(([^\s()]+) ([^\s()]+)\)')
+_bracketRE = re.compile(r'[()]')
+
+
+def splitTrees(text):
+    """
+    The top-level bracketed trees in text
+    """
+    trees = []
+    depth = 0
+    start = None
+    for match in _bracketRE.finditer(text):
+        if match.group() == '(':
+            if depth == 0:
+                start = match.start()
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                trees.append(text[start:match.end()])
+    return trees
+
+
+def convertTree(tree):
+    leaves = [(pos, word) for pos, word in _leafRE.findall(tree) if pos != '-NONE-']
+    lines = []
+    for i, (pos, word) in enumerate(leaves):
+        if word == '*CRASH*':
+            os._exit(3)
+        elif word == '*HANG*':
+            time.sleep(3600)
+        label = 'dep' if i else 'root'
+        lines.append('\t'.join((str(i + 1), word, '_', pos, pos, '_', str(i), label, '_', '_')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def main(stdin=sys.stdin, stdout=sys.stdout):
+    while True:
+        header = stdin.readline()
+        if not header:
+            break
+        trees = stdin.read(int(header))
+        try:
+            reply, status = ''.join(convertTree(tree) for tree in splitTrees(trees)), 'OK'
+        except Exception, e:
+            reply, status = str(e), 'ERR'
+        stdout.write('%s %d\n%s' % (status, len(reply), reply))
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for tree in splitTrees(open(sys.argv[1]).read()):
+            sys.stdout.write(convertTree(tree))
+    else:
+        main()
@@ -0,0 +1,7 @@
+from _ConverterPool import ConverterPool, ConverterError
+from _ConverterPool import javaCommand, standInCommand, STANFORD_BASIC, UNIVERSAL
+from _Batch import convertGroups, splitByCounts, splitSentences
+from _ConversionCache import ConversionCache, converterFingerprint
+from _Pipe import runConverter, streamConverter, iterSentences
+from _Pipeline import pipeline
+from _BuildManifest import BuildManifest, atomicOpen, fileDigest
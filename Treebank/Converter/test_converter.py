@@ -0,0 +1,213 @@
+import os.path
+import shutil
+import tempfile
+import time
+import unittest
+
+from Treebank.Converter import ConverterPool, ConverterError, standInCommand
+from Treebank.Converter import convertGroups, splitByCounts, ConversionCache
+from Treebank.Converter import runConverter, streamConverter, pipeline
+from Treebank.Converter import BuildManifest, atomicOpen
+from Treebank.Converter._StandIn import splitTrees, convertTree
+
+TREES = ['( (S (NP-SBJ (PRP I)) (VP (VBP think) (SBAR (-NONE- 0) (S (NP (PRP it)) (VP (VBZ is)))))))',
+         '( (INTJ (UH uh-huh)))',
+         '( (S (NP-SBJ (PRP we))\n    (VP (VBD did) (NP (PRP it)))))',
+         '( (INTJ (UH yeah)))'] * 5
+
+
+class TestConverterPool(unittest.TestCase):
+    def setUp(self):
+        self.expected = u''.join(convertTree(tree) for tree in TREES)
+
+    def test_stand_in(self):
+        self.assertEqual(splitTrees('\n'.join(TREES)), TREES)
+        self.assertEqual(convertTree(TREES[1]), '1\tuh-huh\t_\tUH\tUH\t_\t0\troot\t_\t_\n\n')
+
+    def test_batches(self):
+        with ConverterPool(standInCommand(), workers=3, batchTokens=4) as pool:
+            self.assertEqual(pool.convert(TREES), self.expected)
+            self.assertEqual(pool.convert(TREES[:1]), convertTree(TREES[0]))
+            self.assertEqual(pool.restarts, 0)
+
+    def test_restart(self):
+        with ConverterPool(standInCommand(), workers=2, batchTokens=4) as pool:
+            for worker in pool._workers:
+                worker.process.kill()
+                worker.process.wait()
+            self.assertEqual(pool.convert(TREES), self.expected)
+            self.assertRaises(ConverterError, pool.convert, ['( (X (NN *CRASH*)))'])
+            self.assertEqual(pool.convert(TREES), self.expected)
+
+    def test_timeout(self):
+        with ConverterPool(standInCommand(), timeout=0.5, retries=0) as pool:
+            self.assertRaises(ConverterError, pool.convert, ['( (X (NN *HANG*)))'])
+            self.assertEqual(pool.restarts, 1)
+            self.assertEqual(pool.convert(TREES), self.expected)
+
+    def test_write_timeout(self):
+        # More than a pipe holds, to a converter that never reads it
+        with ConverterPool(['sleep', '30'], timeout=0.5, retries=0, batchTokens=10 ** 6) as pool:
+            start = time.time()
+            self.assertRaises(ConverterError, pool.convert, TREES * 200)
+            self.assertTrue(time.time() - start < 5)
+            self.assertEqual(pool.restarts, 1)
+
+
+class TestPipe(unittest.TestCase):
+    def test_run(self):
+        command = standInCommand('{trees}')
+        expected = u''.join(convertTree(tree) for tree in TREES)
+        self.assertEqual(runConverter(command, TREES), expected)
+        sentences = list(streamConverter(command, TREES[:3]))
+        self.assertEqual(sentences, [convertTree(tree) for tree in TREES[:3]])
+        self.assertRaises(ConverterError, runConverter, command, ['( (X (NN *CRASH*)))'])
+
+
+class TestBatch(unittest.TestCase):
+    def test_groups(self):
+        groups = [TREES[:3], [], TREES[3:4], TREES[4:]]
+        with ConverterPool(standInCommand(), workers=2, batchTokens=4) as pool:
+            texts = convertGroups(groups, pool.convert)
+            self.assertEqual(texts, [pool.convert(trees) for trees in groups])
+
+    def test_count_check(self):
+        text = u''.join(convertTree(tree) for tree in TREES[:3])
+        self.assertEqual(splitByCounts(text, [2, 1])[1], convertTree(TREES[2]))
+        self.assertRaises(ConverterError, splitByCounts, text, [2, 2])
+
+
+class TestConversionCache(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.location = os.path.join(self.root, 'memo.db')
+        self.sent = []
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def convert(self, trees):
+        self.sent.append(trees)
+        return u''.join(convertTree(tree) for tree in trees)
+
+    def test_memo(self):
+        expected = self.convert(TREES)
+        self.sent = []
+        memo = ConversionCache(self.location, 'stand-in')
+        self.assertEqual(memo.convert(TREES, self.convert), expected)
+        # Each distinct tree is converted once
+        self.assertEqual(self.sent, [TREES[:4]])
+        self.assertEqual(memo.report(), '20 trees, 16 from the conversion cache (80.0%), 4 converted')
+        memo.close()
+        memo = ConversionCache(self.location, 'stand-in')
+        self.assertEqual(memo.convert(TREES[::-1], self.convert), self.convert(TREES[::-1]))
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(memo.hitRate(), 1.0)
+        # Another converter's output is kept apart
+        other = ConversionCache(self.location, 'other')
+        other.convert(TREES[:1], self.convert)
+        self.assertEqual(self.sent[-1], TREES[:1])
+
+    def test_count_check(self):
+        memo = ConversionCache(self.location, 'stand-in')
+        self.assertRaises(ConverterError, memo.convert, TREES[:2], lambda trees: u'')
+
+
+class TestPipeline(unittest.TestCase):
+    def test_order(self):
+        stages = [lambda n: n * 2, str, lambda text: text + '!']
+        self.assertEqual(list(pipeline(xrange(100), stages, queueSize=1)),
+                         ['%d!' % (n * 2) for n in xrange(100)])
+
+    def test_bounded(self):
+        drawn = []
+
+        def items():
+            for n in xrange(1000):
+                drawn.append(n)
+                yield n
+
+        results = pipeline(items(), [str, int], queueSize=1)
+        self.assertEqual(results.next(), 0)
+        time.sleep(0.3)
+        # A queue item and one in hand at each of three queues and threads
+        self.assertTrue(len(drawn) <= 7)
+        self.assertEqual(list(results), range(1, 1000))
+
+    def test_error(self):
+        def stage(n):
+            if n == 5:
+                raise ValueError(n)
+            return n
+
+        results = pipeline(xrange(100), [stage, str], queueSize=2)
+        self.assertEqual([results.next() for i in xrange(5)], map(str, xrange(5)))
+        self.assertRaises(ValueError, list, results)
+
+
+class TestBuildManifest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.processed = []
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def process(self, items):
+        self.processed.append(list(items))
+        return ((item, item.upper()) for item in items)
+
+    def build(self, items, fingerprint='v1', digest=lambda item: item * 2):
+        build = BuildManifest(self.root, fingerprint)
+        results = list(build.results(items, str, digest, self.process))
+        build.close()
+        return results
+
+    def test_reuse(self):
+        expected = [('ab', 'AB'), ('c', 'C')]
+        self.assertEqual(self.build(['ab', 'c']), expected)
+        self.assertEqual(self.build(['ab', 'c']), expected)
+        self.assertEqual(self.build(['ab', 'c', 'd']), expected + [('d', 'D')])
+        self.assertEqual(self.processed, [['ab', 'c'], [], ['d']])
+        # A changed input, or another converter, is processed again
+        self.build(['ab', 'c'], digest=lambda item: 'changed' if item == 'c' else item * 2)
+        self.build(['ab'], fingerprint='v2')
+        self.assertEqual(self.processed[3:], [['c'], ['ab']])
+        self.assertEqual(len(os.listdir(os.path.join(self.root, 'chunks'))), 3)
+
+    def test_resume(self):
+        self.build(['a', 'b'])
+        # A run that died halfway through writing a row
+        with open(os.path.join(self.root, 'manifest.tsv'), 'a') as file_:
+            file_.write('c\t1\t')
+        self.assertEqual(self.build(['a', 'b', 'c']), [('a', 'A'), ('b', 'B'), ('c', 'C')])
+        self.assertEqual(self.processed, [['a', 'b'], ['c']])
+
+    def test_lazy(self):
+        self.build(['a', 'b', 'c'])
+        build = BuildManifest(self.root, 'v1')
+        loaded = []
+        chunk = build.chunk
+        build.chunk = lambda key, digest: loaded.append(key) or chunk(key, digest)
+        results = build.results(['a', 'b', 'c'], str, lambda item: item * 2, self.process)
+        self.assertEqual(loaded, [])
+        self.assertEqual(results.next(), ('a', 'A'))
+        self.assertEqual(loaded, ['a'])
+        build.close()
+
+    def test_atomic(self):
+        location = os.path.join(self.root, 'out.txt')
+        with atomicOpen(location) as file_:
+            file_.write(u'old')
+        try:
+            with atomicOpen(location) as file_:
+                file_.write(u'new')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(open(location).read(), 'old')
+        self.assertEqual(os.listdir(self.root), ['out.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
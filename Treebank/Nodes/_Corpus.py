@@ -1,10 +1,36 @@
+import marshal
 import sys
+from collections import deque, OrderedDict
+from multiprocessing import Pool
 
 from _Node import Node
 from _File import File
 from _Sentence import Sentence
+from _FileCache import FileCache
+
+
+def _encodeFiles(fileClass, kwargsList):
+    """
+    Worker half of parallel reading: parse some files and return each as
+    a marshalled toRecords() string, which is far cheaper to send back
+    than a pickled tree
+    """
+    return [marshal.dumps(fileClass(**kwargs).toRecords(), 2) for kwargs in kwargsList]
+
 
 class Corpus(Node):
+    # Set by cacheFiles
+    fileCache = None
+    # Extra keyword arguments for fileClass
+    fileArgs = {}
+    # A SplitManifest, for corpora that know their splits
+    manifest = None
+    # Set by readInParallel
+    jobs = 1
+    chunkSize = 1
+    readAhead = None
+    _pool = None
+
     def parent(self):
         """
         Raises an error, because the root node has no parent
@@ -30,15 +56,66 @@ class Corpus(Node):
         for node in self.children():
             operation.actOn(node)
             
+    def cacheFiles(self, maxEntries=None, maxBytes=None):
+        """
+        Keep parsed files in an LRU cache, so that reading a file twice
+        doesn't parse it twice. Returns the cache, for its counters
+        """
+        self.fileCache = FileCache(maxEntries=maxEntries, maxBytes=maxBytes)
+        return self.fileCache
+
+    def _cachedFile(self, key, load):
+        if self.fileCache is None:
+            return load()
+        return self.fileCache.get(key, load)
+
+    def readInParallel(self, jobs, chunkSize=1, readAhead=None):
+        """
+        Parse files in a pool of jobs processes when iterating over
+        children() or a subset of them. Files are still yielded in order.
+        Each task parses chunkSize files, and at most readAhead tasks
+        (default 2 * jobs) are in flight or waiting to be yielded, which
+        bounds the memory held by parses that are ready early.
+
+        fileClass must provide toRecords(), and accept its output as
+        records= to rebuild the file. The pool is started here and kept
+        for every read; close() stops it
+        """
+        self.close()
+        self.jobs = jobs
+        self.chunkSize = chunkSize
+        self.readAhead = readAhead
+        if jobs > 1:
+            self._pool = Pool(jobs)
+
+    def close(self):
+        """
+        Stop the processes started by readInParallel. Files are read
+        serially afterwards
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self.jobs = 1
+
     def child(self, index):
         """
         Read a file by zero-index offset
         """
-        path = self._children[index]
-        print >> sys.stderr, path
+        key = self._children[index]
+        return self._cachedFile(key, lambda: self._readFile(key))
+
+    def _fileKwargs(self, key):
+        kwargs = dict(self.fileArgs)
+        kwargs['path'] = key
+        return kwargs
+
+    def _readFile(self, key):
+        print >> sys.stderr, key
         try:
-            return self.fileClass(path=path)
-        except KeyError:
+            return self.fileClass(**self._fileKwargs(key))
+        except (KeyError, ValueError):
             print "Parse error!"
             raise
      
@@ -47,19 +124,105 @@ class Corpus(Node):
         """
         Generator to iterate through children
         """
-        for i in xrange(len(self._children)):
-            yield self.child(i)
+        return self._readChildren(xrange(len(self._children)))
+
+    # _children holds file keys rather than files, so the walks read the
+    # files through children()
+    def depthList(self):
+        """
+        Depth-first node list
+        """
+        nodes = []
+        for file_ in self.children():
+            nodes.append(file_)
+            nodes.extend(file_.depthList())
+        return nodes
+
+    def breadthList(self):
+        """
+        Breadth-first node list
+        """
+        nodes = list(self.children())
+        i = 0
+        while i < len(nodes):
+            nodes.extend(nodes[i].children())
+            i += 1
+        return nodes
+
+    def _wordYield(self):
+        # Not memoised, since the files may not stay in memory
+        return [node for node in self.depthList() if node.isLeaf()]
+
+    def splitFiles(self, *splits):
+        """
+        Generate the files in any of the named splits of the manifest,
+        in corpus order
+        """
+        return self._readChildren(self.manifest.indices(*splits))
+
+    def _readChildren(self, indices):
+        """
+        Yield the children at indices, in parallel if readInParallel was called
+        """
+        if self._pool is None:
+            return (self.child(i) for i in indices)
+        return self._readChildrenInParallel(list(indices))
+
+    def _readChildrenInParallel(self, indices):
+        chunks = [indices[i:i + self.chunkSize] for i in xrange(0, len(indices), self.chunkSize)]
+        chunks.reverse()
+        readAhead = self.readAhead or 2 * self.jobs
+        pending = deque()
+        while chunks or pending:
+            while chunks and len(pending) < readAhead:
+                chunk = chunks.pop()
+                # Files already in memory don't need to be sent out
+                toRead = [i for i in chunk if self.fileCache is None or
+                          self._children[i] not in self.fileCache]
+                kwargsList = [self._fileKwargs(self._children[i]) for i in toRead]
+                task = self._pool.apply_async(_encodeFiles, (self.fileClass, kwargsList))
+                pending.append((chunk, toRead, task))
+            chunk, toRead, task = pending.popleft()
+            encoded = dict(zip(toRead, task.get()))
+            for i in chunk:
+                if i not in encoded:
+                    yield self.child(i)
+                    continue
+                key = self._children[i]
+                print >> sys.stderr, key
+                kwargs = self._fileKwargs(key)
+                kwargs['records'] = marshal.loads(encoded.pop(i))
+                file_ = self.fileClass(**kwargs)
+                if self.fileCache is not None:
+                    self.fileCache.put(key, file_)
+                yield file_
     
     def file(self, key):
         """
         Read a file by path
         """
-        return self.fileClass(path=key)
+        return self._cachedFile(key, lambda: self.fileClass(**self._fileKwargs(key)))
             
     def sentence(self, key):
         filename, sentenceKey = key.split('~')
+        return self._sentencesInFile(filename, [key])[0]
+
+    def sentenceList(self, keys):
+        """
+        Retrieve sentences by key, in the order given. Keys are grouped
+        by file, so that each file is only read once
+        """
+        byFile = OrderedDict()
+        for key in keys:
+            byFile.setdefault(key.split('~')[0], []).append(key)
+        found = {}
+        for filename, fileKeys in byFile.items():
+            found.update(zip(fileKeys, self._sentencesInFile(filename, fileKeys)))
+        return [found[key] for key in keys]
+
+    def _sentencesInFile(self, filename, keys):
         file_ = self.file(filename)
-        return file_.sentence(key)
+        return [file_.sentence(key) for key in keys]
 
     def sentences(self):
         for child in self.children():
@@ -16,6 +16,7 @@ class File(Node):
         # Sentence without complaint
         self._children.append(newChild)
         self._IDDict[newChild.globalID] = newChild
+        self._structureChanged()
     
     def detachChild(self, node):
         """
@@ -23,6 +24,12 @@ class File(Node):
         """
         self._children.remove(node)
         self._IDDict.pop(node.globalID)
+        self._structureChanged()
+
+    def _wordYield(self):
+        # Sentences don't point back to their file, so changes inside them
+        # can't invalidate a memo here. Rely on theirs instead
+        return [w for sentence in self._children for w in sentence._wordYield()]
     
     def sentence(self, key):
         """
@@ -0,0 +1,100 @@
+from collections import OrderedDict
+
+# Rough cost of one parsed node: the slotted object, its children list and
+# its share of the memoised word yields
+NODE_BYTES = 300
+# Bracketed text runs to about a node per ten characters, and a lazy file
+# holds the text as well
+CHAR_BYTES = NODE_BYTES // 10 + 1
+
+
+def approximateSize(file_):
+    """
+    Guess the memory a parsed file holds, from its node count. A lazy
+    file's guess comes from the length of its text, so that caching it
+    doesn't parse it
+    """
+    text = getattr(file_, '_text', None)
+    if text is not None:
+        return len(text) * CHAR_BYTES
+    nNodes = 0
+    for sentence in file_.children():
+        nNodes += 1 + len(sentence.depthList())
+    return nNodes * NODE_BYTES
+
+
+class FileCache(object):
+    """
+    Least-recently-used cache of parsed files, bounded by entry count,
+    approximate size in bytes, or both
+
+    Counts hits, misses and evictions, so the bounds can be tuned.
+    Cached files are shared between callers: changes made to a file's
+    trees are seen the next time it is read from the cache.
+    """
+    def __init__(self, maxEntries=None, maxBytes=None, sizeOf=approximateSize):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.sizeOf = sizeOf
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, load):
+        """
+        Return the file cached under key, calling load() to read it on a miss
+        """
+        try:
+            value, size = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            value = load()
+            self.put(key, value)
+            return value
+        self.hits += 1
+        self._entries[key] = (value, size)
+        return value
+
+    def put(self, key, value):
+        if key in self._entries:
+            self._remove(key)
+        size = self.sizeOf(value) if self.maxBytes is not None else 0
+        self._entries[key] = (value, size)
+        self.bytes += size
+        self._evict()
+
+    def _remove(self, key):
+        value, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def _evict(self):
+        # Always keep the newest entry, even if it alone is over the limit
+        while len(self._entries) > 1 and self._overLimit():
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _overLimit(self):
+        if self.maxEntries is not None and len(self._entries) > self.maxEntries:
+            return True
+        if self.maxBytes is not None and self.bytes > self.maxBytes:
+            return True
+        return False
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
@@ -5,6 +5,7 @@ class Leaf(Node):
     A leaf of the parse tree -- ie, a word, punctuation or trace
     Cannot attach or retrieve children
     """
+    __slots__ = ()
     def __hash__(self):
         return self.wordID
 
@@ -35,6 +36,9 @@ class Leaf(Node):
     
     def listWords(self):
         return [self]
+
+    def _wordYield(self):
+        return [self]
         
     def lemma(self):
         """
@@ -79,7 +83,7 @@ class Leaf(Node):
         return bool(self.label in punct)
 
     def nextWord(self):
-        words = self.root().listWords()
+        words = self.root()._wordYield()
         nextID = self.wordID + 1
         if nextID == len(words):
             return None
@@ -90,5 +94,5 @@ class Leaf(Node):
     def prevWord(self):
         if self.wordID == 0:
             return None
-        words = self.root().listWords()
+        words = self.root()._wordYield()
         return words[self.wordID - 1]
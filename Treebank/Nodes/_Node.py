@@ -1,4 +1,7 @@
 import bisect
+from operator import methodcaller
+
+import _Traversal
 
 class AttachmentError(Exception):
     def __init__(self, value):
@@ -7,12 +10,22 @@ class AttachmentError(Exception):
         return repr(self.value)
 
 class Node(object):
-    globalID = 0
+    # Trees are built from millions of nodes, so the node classes declare
+    # __slots__. Classes used as the first base of a multiple-inheritance
+    # node (Leaf, Sentence) add none of their own, to keep the layouts
+    # compatible; File and Corpus keep a __dict__.
+    __slots__ = ('globalID', 'label', '_children', '_parent', '_version',
+                 '_wordCache')
+    nextGlobalID = 0
     def __init__(self, label):
-        self.globalID = Node.globalID
+        self.globalID = Node.nextGlobalID
         self._children = []
         self._parent = None
-        Node.globalID += 1
+        # Bumped whenever the subtree below this node changes shape, so that
+        # the memoised word yield can tell when it is stale
+        self._version = 0
+        self._wordCache = None
+        Node.nextGlobalID += 1
         self.label = label
         
     def __hash__(self):
@@ -42,13 +55,16 @@ class Node(object):
             raise AttachmentError('Cannot attach node: %s to: %s Node is already attached to %s' \
             % (newChild.prettyPrint(), self.prettyPrint(), newChild.parent().prettyPrint()))
         if index == None:
-            if not self._children:
+            key = newChild.sortKey()
+            if not self._children or key >= self._children[-1].sortKey():
                 self._children.append(newChild)
             else:
-                bisect.insort_right(self._children, newChild)
+                keys = [child.sortKey() for child in self._children]
+                self._children.insert(bisect.bisect_right(keys, key), newChild)
         else:
             self._children.insert(index, newChild)
         newChild.setParent(self)
+        self._structureChanged()
         
         
     def _detachFromParent(self):
@@ -60,6 +76,17 @@ class Node(object):
         Detach a specific node. Deprecated; use node.prune()
         """
         self._children.remove(node)
+        self._structureChanged()
+
+    def _structureChanged(self):
+        """
+        Bump the structural version of this node and its ancestors,
+        invalidating their memoised word yields
+        """
+        node = self
+        while node is not None:
+            node._version += 1
+            node = node._parent
         
         
     def setParent(self, node):
@@ -135,59 +162,81 @@ class Node(object):
         """
         Sort children in-place. Should not be necessary, but just in case...
         """
-        decorated = [(c.getWordID(0), c) for c in self._children]
-        decorated.sort()
-        self._children = [d[1] for d in decorated]
+        self._children.sort(key=methodcaller('sortKey'))
+        self._structureChanged()
+
+    def sortKey(self):
+        """
+        Key for ordering nodes by position: the ID of the first word.
+        Read from the memoised word yield, so it is cheap until the
+        subtree changes
+        """
+        return self.getWordID(0)
         
     def depthList(self):
         """
         Depth-first node list
         """
-        # Avoid recursion, for speed
-        queue = list(self.children())
-        # Can't use enumerate because changing list in place
-        # Must stay 1 ahead of the current index
-        i = 0
-        for node in queue:
-            i += 1
-            if not node.isLeaf():
-                for j, child in enumerate(node.children()):
-                    queue.insert(i+j, child)
-        return queue
+        return _Traversal.preorder(self)
         
     def breadthList(self):
         """
         Breadth-first node list
         """
-        children = [child for child in self.children()]
-        for child in children:
-            for subChild in child.children():
-                children.append(subChild)
-        return children
+        return _Traversal.breadth(self)
         
     def getWordID(self, index):
         """
         Word ID at index. Generally 0 or -1
         """
-        wordIDList = [word.wordID for word in self.listWords()]
-        if not wordIDList:
+        words = self._wordYield()
+        if not words:
             return 0
-        return wordIDList[index]
+        return words[index].wordID
         
     def getWord(self, index):
         """
         Word ID at index. Generally 0 or -1
         """
-        wordList = self.listWords()
-        if not wordList:
+        words = self._wordYield()
+        if not words:
+            return None
+        return words[index]
+
+    def span(self):
+        """
+        The IDs of the first and last words, or None if there are no words
+        """
+        words = self._wordYield()
+        if not words:
             return None
-        return wordList[index]
+        return words[0].wordID, words[-1].wordID
         
     def listWords(self):
         """
         List the word yield of the node
         """
-        return [n for n in self.depthList() if n.isLeaf()]
+        return list(self._wordYield())
+
+    def wordIndex(self, word):
+        """
+        Position of a word in the word yield of the node
+        """
+        self._wordYield()
+        # Keyed by identity, since Leaf hashes by wordID
+        return self._wordCache[2][id(word)]
+
+    def _wordYield(self):
+        """
+        The memoised word yield. Do not modify the returned list
+        """
+        cache = self._wordCache
+        if cache is None or cache[0] != self._version:
+            words = _Traversal.leaves(self)
+            positions = dict((id(w), i) for i, w in enumerate(words))
+            cache = (self._version, words, positions)
+            self._wordCache = cache
+        return cache[1]
         
     def length(self, constraint = None):
         """
@@ -260,12 +309,12 @@ class Node(object):
     
     def __cmp__(self, obj):
         """
-        The deprecated complicated (and crushingly slow) cmp is used in the SFG
-        stuff
+        The deprecated complicated cmp is used in the SFG stuff. Nothing in
+        the tree code relies on it any more; sort on sortKey() instead
         """
        # return cmp(self.globalID, obj.globalID)
-        selfID = float(self.getWordID(0))
-        objID = float(obj.getWordID(0))
+        selfID = float(self.sortKey())
+        objID = float(obj.sortKey())
         if selfID == -1:
             return 0
         elif objID == -1:
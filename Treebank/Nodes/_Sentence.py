@@ -5,6 +5,7 @@ from _Printer import Printer
 
 
 class Sentence(Node):
+    __slots__ = ()
     _printer = Printer()
     def __str__(self):
         return self._printer(self)
@@ -0,0 +1,91 @@
+"""
+Linear-time tree traversal
+
+The iterators walk a node's descendants (not the node itself) using an
+explicit stack or deque, so they never recurse and never insert into the
+middle of a list. A node's children are read when the walk moves on from
+it, so pruning the node being visited is safe (its subtree is still
+walked), but changes further down the tree are seen by the walk. Nodes without a
+_children list, like the compact sentences, are read through children().
+"""
+from collections import deque
+
+
+def _childList(node):
+    try:
+        return node._children
+    except AttributeError:
+        return list(node.children())
+
+
+def iterPreorder(node):
+    """
+    Generate descendants depth-first, parents before children
+    """
+    stack = list(reversed(_childList(node)))
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(_childList(node)))
+
+
+def iterPostorder(node):
+    """
+    Generate descendants depth-first, children before parents
+    """
+    stack = [(child, False) for child in reversed(_childList(node))]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded or not _childList(node):
+            yield node
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(_childList(node)))
+
+
+def iterBreadth(node):
+    """
+    Generate descendants breadth-first
+    """
+    queue = deque(_childList(node))
+    while queue:
+        node = queue.popleft()
+        yield node
+        queue.extend(_childList(node))
+
+
+def iterLeaves(node):
+    """
+    Generate the leaves below node, in sentence order
+    """
+    for node in iterPreorder(node):
+        if node.isLeaf():
+            yield node
+
+
+def preorder(node):
+    """
+    Depth-first node list, as built by Node.depthList
+    """
+    return list(iterPreorder(node))
+
+
+def postorder(node):
+    return list(iterPostorder(node))
+
+
+def breadth(node):
+    """
+    Breadth-first node list, as built by Node.breadthList
+    """
+    nodes = list(_childList(node))
+    # The list grows as it is read, so it doubles as the queue
+    i = 0
+    while i < len(nodes):
+        nodes.extend(_childList(nodes[i]))
+        i += 1
+    return nodes
+
+
+def leaves(node):
+    return [n for n in preorder(node) if n.isLeaf()]
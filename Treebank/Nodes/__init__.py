@@ -3,4 +3,7 @@ from _File import File
 from _Sentence import Sentence
 from _Node import Node
 from _Leaf import Leaf
+from _FileCache import FileCache
 from _PropbankPrinter import PropbankPrinter
+from _Traversal import iterPreorder, iterPostorder, iterBreadth, iterLeaves
+from _Traversal import preorder, postorder, breadth, leaves
@@ -0,0 +1,475 @@
+from array import array
+from collections import deque
+
+from Treebank.Nodes import Node
+
+from _PTBNode import PTBNode
+from _PTBLeaf import PTBLeaf
+from _PTBSentence import PTBSentence
+from _Symbols import symbols, TRACE
+
+# Word positions and node indices are stored as C ints, times as doubles.
+# A missing time (None) is stored as NaN
+_NAN = float('nan')
+_UNF = 1
+_LEAF = 2
+_typecodes = {'_flags': 'B', '_startTimes': 'd', '_endTimes': 'd'}
+
+
+def _packTime(time):
+    if time is None:
+        return _NAN
+    return float(time)
+
+
+def _unpackTime(time):
+    if time != time:
+        return None
+    # parse_time uses the integer -1 for non-aligned words
+    elif time == -1:
+        return -1
+    return time
+
+
+def _initNode(node, label, functionLabel, identifier, identified, start_time,
+              end_time, unf):
+    """
+    Fill in the slots that Node.__init__ and PTBNode.__init__ would set
+    """
+    node.globalID = Node.nextGlobalID
+    Node.nextGlobalID += 1
+    node.label = label
+    node._children = []
+    node._parent = None
+    node._version = 0
+    node._wordCache = None
+    node.functionLabel = functionLabel
+    node.identifier = identifier
+    node.identified = identified
+    node._start_time = start_time
+    node._end_time = end_time
+    node.unf = unf
+    node.traced = None
+
+
+class CompactNode(object):
+    """
+    A read-only view of one node of a CompactSentence
+
+    Views are created on demand and hold only the sentence and an index,
+    so they can be thrown away freely. They support the read side of the
+    Node interface used by the scripts.
+    """
+    __slots__ = ('_sent', '_idx')
+
+    def __init__(self, sentence, index):
+        self._sent = sentence
+        self._idx = index
+
+    def __hash__(self):
+        return hash((id(self._sent), self._idx))
+
+    def __eq__(self, other):
+        return isinstance(other, CompactNode) and self._sent is other._sent \
+            and self._idx == other._idx
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __len__(self):
+        return self.length()
+
+    def __nonzero__(self):
+        return True
+
+    def __str__(self):
+        return self.prettyPrint()
+
+    @property
+    def label(self):
+        return symbols.string(self._sent._labels[self._idx])
+
+    @property
+    def functionLabel(self):
+        return symbols.string(self._sent._functionLabels[self._idx])
+
+    @property
+    def identifier(self):
+        return symbols.string(self._sent._identifiers[self._idx])
+
+    @property
+    def identified(self):
+        return symbols.string(self._sent._identified[self._idx])
+
+    @property
+    def unf(self):
+        return bool(self._sent._flags[self._idx] & _UNF)
+
+    @property
+    def start_time(self):
+        return _unpackTime(self._sent._startTimes[self._idx])
+
+    @property
+    def end_time(self):
+        return _unpackTime(self._sent._endTimes[self._idx])
+
+    @property
+    def traced(self):
+        index = self._sent._traced[self._idx]
+        if index == -1:
+            return None
+        return self._sent._view(index)
+
+    @property
+    def wordID(self):
+        return self._sent._wordIDs[self._wordPosition()]
+
+    @property
+    def text(self):
+        return self._sent._texts[self._wordPosition()]
+
+    def _wordPosition(self):
+        if not self.isLeaf():
+            raise AttributeError("Only leaves have words")
+        return self._sent._wordStarts[self._idx]
+
+    def isLeaf(self):
+        return bool(self._sent._flags[self._idx] & _LEAF)
+
+    def isRoot(self):
+        return False
+
+    def parent(self):
+        return self._sent._view(self._sent._parents[self._idx])
+
+    def root(self):
+        return self._sent
+
+    def ancestors(self):
+        node = self
+        while not node.isRoot():
+            node = node.parent()
+            yield node
+
+    def _childIndices(self):
+        offsets = self._sent._childOffsets
+        return xrange(offsets[self._idx], offsets[self._idx + 1])
+
+    def child(self, index):
+        if self.isLeaf():
+            raise AttributeError("Cannot retrieve children from leaf nodes! Attempted on leaf:\n\n%s" % self.prettyPrint())
+        return self._sent._view(self._childIndices()[index])
+
+    def children(self):
+        for index in self._childIndices():
+            yield self._sent._view(index)
+
+    def length(self, constraint=None):
+        if constraint is None:
+            return len(self._childIndices())
+        return len([c for c in self.children() if constraint(c)])
+
+    def siblings(self):
+        return [s for s in self.parent().children() if s != self]
+
+    def isUnary(self):
+        return self.length() == 1 and not self.child(0).isLeaf()
+
+    def depthList(self):
+        """
+        Depth-first node list
+        """
+        nodes = []
+        offsets = self._sent._childOffsets
+        stack = list(reversed(self._childIndices()))
+        while stack:
+            index = stack.pop()
+            nodes.append(self._sent._view(index))
+            stack.extend(reversed(xrange(offsets[index], offsets[index + 1])))
+        return nodes
+
+    def breadthList(self):
+        """
+        Breadth-first node list
+        """
+        nodes = []
+        offsets = self._sent._childOffsets
+        queue = deque(self._childIndices())
+        while queue:
+            index = queue.popleft()
+            nodes.append(self._sent._view(index))
+            queue.extend(xrange(offsets[index], offsets[index + 1]))
+        return nodes
+
+    def listWords(self):
+        """
+        List the word yield of the node, read straight from the word span
+        """
+        sent = self._sent
+        positions = xrange(sent._wordStarts[self._idx], sent._wordEnds[self._idx])
+        return [sent._view(sent._wordNodes[i]) for i in positions]
+
+    _wordYield = listWords
+
+    def wordIndex(self, word):
+        """
+        Position of a word in the word yield of the node
+        """
+        sent = self._sent
+        if word._sent is not sent or not word.isLeaf():
+            raise KeyError(word)
+        position = sent._wordStarts[word._idx]
+        if not sent._wordStarts[self._idx] <= position < sent._wordEnds[self._idx]:
+            raise KeyError(word)
+        return position - sent._wordStarts[self._idx]
+
+    def _wordIDSlice(self):
+        sent = self._sent
+        return sent._wordIDs[sent._wordStarts[self._idx]:sent._wordEnds[self._idx]]
+
+    def span(self):
+        wordIDs = self._wordIDSlice()
+        if not wordIDs:
+            return None
+        return wordIDs[0], wordIDs[-1]
+
+    def sortKey(self):
+        sent = self._sent
+        start = sent._wordStarts[self._idx]
+        if start == sent._wordEnds[self._idx]:
+            return 0
+        return sent._wordIDs[start]
+
+    def getWordID(self, index):
+        wordIDs = self._wordIDSlice()
+        if not wordIDs:
+            return 0
+        return wordIDs[index]
+
+    def getWord(self, index):
+        words = self.listWords()
+        if not words:
+            return None
+        return words[index]
+
+    def isTrace(self):
+        return self.label is TRACE
+
+    def isPunct(self):
+        return PTBLeaf.isPunct.im_func(self)
+
+    def isEdited(self):
+        return PTBLeaf.isEdited.im_func(self)
+
+    def isPartial(self):
+        return PTBLeaf.isPartial.im_func(self)
+
+    def duration(self):
+        return PTBNode.duration.im_func(self)
+
+    def gapAfter(self):
+        return PTBNode.gapAfter.im_func(self)
+
+    def head(self):
+        return self.getWord(-1)
+
+    def prettyPrint(self):
+        if self.isLeaf():
+            return "(%s %s)" % (self.label, self.text)
+        return "(%s %s)" % (self.label, ' '.join([child.prettyPrint() for child in self.children()]))
+
+
+class CompactSentence(CompactNode):
+    """
+    A PTBSentence stored as a struct of arrays
+
+    Nodes are numbered breadth-first from the root, so the children of each
+    node occupy a contiguous index range and only one offset per node is
+    needed. Leaves occupy a contiguous range of word positions under each
+    node, which gives the word yield without any traversal.
+
+    Build one with the same keyword arguments as PTBSentence, or from an
+    existing tree with sentence=. The tree is read-only; use toSentence()
+    to get a mutable PTBSentence back.
+    """
+    __slots__ = ('globalID', 'localID', 'speaker', 'turnID', '_parents',
+                 '_childOffsets', '_labels', '_functionLabels', '_identifiers',
+                 '_identified', '_flags', '_traced', '_startTimes', '_endTimes',
+                 '_wordStarts', '_wordEnds', '_wordNodes', '_wordIDs', '_texts')
+
+    def __init__(self, **kwargs):
+        sentence = kwargs.pop('sentence', None)
+        if sentence is None:
+            sentence = PTBSentence(**kwargs)
+        elif kwargs:
+            raise StandardError, kwargs
+        CompactNode.__init__(self, self, 0)
+        self._compact(sentence)
+
+    def _compact(self, sentence):
+        self.globalID = sentence.globalID
+        self.localID = sentence.localID
+        self.speaker = sentence.speaker
+        self.turnID = sentence.turnID
+        # Number the nodes breadth-first
+        order = [sentence]
+        index = {sentence: 0}
+        offsets = array('i', [1])
+        for node in order:
+            if not node.isLeaf():
+                for child in node._children:
+                    index[child] = len(order)
+                    order.append(child)
+            offsets.append(len(order))
+        self._childOffsets = offsets
+        self._parents = array('i', [-1] + [index[n._parent] for n in order[1:]])
+        self._labels = array('i', [symbols.id(n.label) for n in order])
+        self._functionLabels = array('i', [symbols.id(n.functionLabel) for n in order])
+        self._identifiers = array('i', [symbols.id(n.identifier) for n in order])
+        self._identified = array('i', [symbols.id(n.identified) for n in order])
+        self._flags = array('B', [(_UNF if n.unf else 0) | (_LEAF if n.isLeaf() else 0)
+                                  for n in order])
+        self._traced = array('i', [index.get(n.traced, -1) for n in order])
+        self._startTimes = array('d', [_packTime(n.start_time) for n in order])
+        self._endTimes = array('d', [_packTime(n.end_time) for n in order])
+        # Word spans, assigned in a depth-first walk so that leaves are in
+        # sentence order
+        words = sentence.listWords()
+        self._wordNodes = array('i', [index[w] for w in words])
+        self._wordIDs = array('i', [w.wordID for w in words])
+        self._texts = tuple(w.text for w in words)
+        starts = array('i', [0]) * len(order)
+        ends = array('i', [0]) * len(order)
+        self._computeSpans(0, 0, starts, ends)
+        self._wordStarts = starts
+        self._wordEnds = ends
+
+    def _computeSpans(self, root, position, starts, ends):
+        """
+        Fill in the word span of every node below root, without recursion
+        """
+        offsets = self._childOffsets
+        stack = [(root, False)]
+        while stack:
+            index, visited = stack.pop()
+            if visited:
+                ends[index] = position
+            elif self._flags[index] & _LEAF:
+                starts[index] = position
+                position += 1
+                ends[index] = position
+            else:
+                starts[index] = position
+                stack.append((index, True))
+                stack.extend((c, False) for c in
+                             reversed(xrange(offsets[index], offsets[index + 1])))
+        return position
+
+    def _view(self, index):
+        if index == 0:
+            return self
+        return CompactNode(self, index)
+
+    def isRoot(self):
+        return True
+
+    def parent(self):
+        """
+        Raises an error, because the root node has no parent
+        """
+        raise AttributeError, "Cannot retrieve the parent of the root node! Current parse state:\n\n%s" % self.prettyPrint()
+
+    def __str__(self):
+        return str(self.toSentence())
+
+    def addTurn(self, speaker, turnID):
+        self.speaker = speaker
+        self.turnID = turnID
+
+    def nodeCount(self):
+        return len(self._parents)
+
+    _arrayFields = ('_parents', '_childOffsets', '_flags', '_traced', '_startTimes',
+                    '_endTimes', '_wordStarts', '_wordEnds', '_wordNodes', '_wordIDs')
+    _symbolFields = ('_labels', '_functionLabels', '_identifiers', '_identified')
+
+    def toRecord(self, strings):
+        """
+        Encode the sentence as a tuple of strings, ints and tuples, which
+        marshal can store. Symbol ids are translated to ids in strings, a
+        SymbolTable shared by the records of a file, since the process-wide
+        ids differ from run to run
+        """
+        metadata = (self.globalID, self.localID, self.speaker, self.turnID)
+        arrays = tuple(getattr(self, field).tostring() for field in self._arrayFields)
+        labels = tuple(array('i', [strings.id(symbols.string(i)) for i in getattr(self, field)]).tostring()
+                       for field in self._symbolFields)
+        return metadata, arrays, labels, self._texts
+
+    @classmethod
+    def fromRecord(cls, record, symbolIDs):
+        """
+        Rebuild a sentence from toRecord's output. symbolIDs maps the
+        record's string ids to process-wide symbol ids
+        """
+        metadata, arrays, labels, texts = record
+        sentence = cls.__new__(cls)
+        CompactNode.__init__(sentence, sentence, 0)
+        sentence.globalID, sentence.localID, sentence.speaker, sentence.turnID = metadata
+        for field, data in zip(cls._arrayFields, arrays):
+            values = array(_typecodes.get(field, 'i'))
+            values.fromstring(data)
+            setattr(sentence, field, values)
+        for field, data in zip(cls._symbolFields, labels):
+            values = array('i')
+            values.fromstring(data)
+            setattr(sentence, field, array('i', [symbolIDs[i] for i in values]))
+        sentence._texts = texts
+        return sentence
+
+    def toSentence(self):
+        """
+        Build a mutable PTBSentence with the same tree
+
+        The nodes are filled in directly rather than through their
+        constructors, since the labels are already parsed and the
+        structure is already known; this is what makes reading a cached
+        parse cheaper than parsing.
+        """
+        string = symbols.string
+        flags = self._flags
+        wordStarts = self._wordStarts
+        startTimes = self._startTimes
+        endTimes = self._endTimes
+        nodes = []
+        for index in xrange(len(self._parents)):
+            if index == 0:
+                node = PTBSentence.__new__(PTBSentence)
+            elif flags[index] & _LEAF:
+                node = PTBLeaf.__new__(PTBLeaf)
+                position = wordStarts[index]
+                node.wordID = self._wordIDs[position]
+                node.text = node.lemma = self._texts[position]
+                node.synsets = []
+                node.supersenses = []
+            else:
+                node = PTBNode.__new__(PTBNode)
+            _initNode(node, string(self._labels[index]),
+                      string(self._functionLabels[index]), string(self._identifiers[index]),
+                      string(self._identified[index]), _unpackTime(startTimes[index]),
+                      _unpackTime(endTimes[index]), bool(flags[index] & _UNF))
+            if index != 0:
+                parent = nodes[self._parents[index]]
+                node._parent = parent
+                parent._children.append(node)
+            nodes.append(node)
+        for index, traced in enumerate(self._traced):
+            if traced != -1:
+                nodes[index].traced = nodes[traced]
+        sentence = nodes[0]
+        # Sentences take their IDs from the file, not the node counter
+        sentence.globalID = self.globalID
+        sentence.localID = self.localID
+        sentence.speaker = self.speaker
+        sentence.turnID = self.turnID
+        return sentence
@@ -0,0 +1,87 @@
+"""
+Precompiled NXT dialogues
+
+A bundle joins the terminals, syntax and turns layers of both speakers
+of a dialogue into one file, <NXT root>/bundle/<file id>.bundle. It
+holds the dialogue's sentences as CompactSentence records, so nodes are
+integer indices into parent, label, time and word arrays, and hrefs are
+already resolved. Each record carries its sentence's speaker and turn,
+and the bundle also keeps the (speaker, parse number) key of each
+sentence. NXTFile loads a bundle in place of the XML whenever one exists
+and is newer than the six XML files; bin/nxt_bundle.py writes them.
+"""
+import marshal
+import os
+import tempfile
+
+from _ParseCache import encodeSentences, decodeSentences, _PLATFORM
+
+# Bump when the layout changes
+BUNDLE_VERSION = 1
+
+
+def bundlePath(nxt_root_dir, file_id):
+    return os.path.join(nxt_root_dir, 'bundle', '%s.bundle' % file_id)
+
+
+def bundleStamp(sources):
+    # Names rather than paths, so a corpus can be moved with its bundles
+    stamp = []
+    for path in sources:
+        stat = os.stat(path)
+        stamp.append((os.path.basename(path), stat.st_mtime, stat.st_size))
+    return stamp
+
+
+def readBundle(nxt_root_dir, file_id, sources):
+    """
+    Return (sentences, xmlKeys) from a dialogue's bundle, or None if it
+    has none or the bundle is older than the sources
+    """
+    try:
+        with open(bundlePath(nxt_root_dir, file_id), 'rb') as file_:
+            if not _isFresh(file_, sources):
+                return None
+            encoded = marshal.load(file_)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+    return decodeSentences(encoded)
+
+
+def isFresh(nxt_root_dir, file_id, sources):
+    """
+    Whether the dialogue has a bundle newer than its sources, without
+    reading the sentences
+    """
+    try:
+        with open(bundlePath(nxt_root_dir, file_id), 'rb') as file_:
+            return _isFresh(file_, sources)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return False
+
+
+def _isFresh(file_, sources):
+    # The header and stamp are a separate marshal object before the
+    # sentences, so they can be checked without loading the rest
+    header, stamp = marshal.load(file_)
+    return header == (BUNDLE_VERSION, _PLATFORM) and stamp == bundleStamp(sources)
+
+
+def writeBundle(nxt_root_dir, file_id, sources, sentences, xmlKeys, stamp=None):
+    """
+    Save a dialogue's sentences, with the xml_idx key of each. stamp is
+    bundleStamp(sources) from before the sentences were read, so that a
+    bundle of XML that changed meanwhile is never taken for fresh
+    """
+    if stamp is None:
+        stamp = bundleStamp(sources)
+    location = bundlePath(nxt_root_dir, file_id)
+    directory = os.path.dirname(location)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # Write then rename, so that concurrent readers never see half a file
+    handle, tmpLocation = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'wb') as file_:
+        marshal.dump(((BUNDLE_VERSION, _PLATFORM), stamp), file_, 2)
+        marshal.dump(encodeSentences(sentences, xmlKeys), file_, 2)
+    os.rename(tmpLocation, location)
@@ -2,21 +2,137 @@ from Treebank.Nodes import File
 from _PTBNode import PTBNode
 from _PTBSentence import PTBSentence
 from _PTBLeaf import PTBLeaf
+from _CompactSentence import CompactSentence
+from _ParseCache import encodeSentences, decodeSentences
+from _Symbols import parseLabel
+from _NXTBundle import readBundle, writeBundle, bundleStamp
 
 import os.path
+import re
 from xml.etree import cElementTree as etree
 
+# Sentences start on lines beginning with (
+_sentenceStartRE = re.compile(r'^\(', re.M)
+# The first labelled bracket inside the sentence's own opens its top
+# constituent, as in PTBSentence._parseString
+_topLabelRE = re.compile(r'\(([^\s()]+)')
+
+
+def sentenceSpans(text):
+    """
+    (start, end) offsets of the sentences in text, which must already be
+    stripped. text[start:end] is the bracketed sentence
+    """
+    # Detect the start of sentences by line starting with (
+    # This is messy, but it keeps bracket parsing at the sentence level
+    starts = [0] + [m.start() for m in _sentenceStartRE.finditer(text) if m.start()]
+    ends = [start - 1 for start in starts[1:]] + [len(text)]
+    return zip(starts, ends)
+
+
+_terminalTags = ('word', 'punc', 'trace', 'sil')
+
+
+def _documentKey(sentence):
+    """
+    A sentence's sortKey(), without walking a PTBSentence read from NXT
+    """
+    key = getattr(sentence, '_documentKey', None)
+    return sentence.sortKey() if key is None else key
+
+
+def _iterRootChildren(location, tags):
+    """
+    Generate the elements with the given tags just below the root of an
+    XML file, as each is completed. Each is freed, along with anything
+    before it, once the caller moves on, so memory stays flat
+    """
+    context = etree.iterparse(location, events=('start', 'end'))
+    event, root = next(context)
+    for event, elem in context:
+        if event == 'end' and elem.tag in tags:
+            yield elem
+            root.clear()
+
+
+class _Unparsed(object):
+    """
+    Stands in for a sentence of a lazy PTBFile until it is read
+    """
+    __slots__ = ('start', 'end', 'globalID', 'localID')
+
+    def __init__(self, start, end, globalID, localID):
+        self.start = start
+        self.end = end
+        self.globalID = globalID
+        self.localID = localID
+
+
+class _LazySentences(list):
+    """
+    The sentence list of a lazy PTBFile. Placeholders are swapped for
+    parsed sentences whenever they are read through indexing or iteration,
+    so code that walks _children directly still sees sentences
+    """
+    def __init__(self, items, load):
+        list.__init__(self, items)
+        self._load = load
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        item = list.__getitem__(self, index)
+        if type(item) is _Unparsed:
+            item = self._load(item)
+            list.__setitem__(self, index, item)
+        return item
+
+    def __getslice__(self, start, end):
+        return self[max(start, 0):max(end, 0):]
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def __reversed__(self):
+        for i in xrange(len(self) - 1, -1, -1):
+            yield self[i]
+
+    def sort(self, *args, **kwargs):
+        for sentence in self:
+            pass
+        list.sort(self, *args, **kwargs)
+
+    def isParsed(self, index):
+        return type(list.__getitem__(self, index)) is not _Unparsed
+
 
 class PTBFile(File, PTBNode):
     """
     A Penn Treebank file
+
+    Pass compact=True to store the sentences as CompactSentence arrays
+    instead of node objects, and cache=ParseCache(...) to reuse the parse
+    of an unchanged file from disk. records= builds the file from the
+    output of toRecords() instead of parsing it.
+
+    lazy=True only finds where each sentence starts, and parses a sentence
+    when it is first read. topLabel() can then filter sentences without
+    parsing them. A lazy file still uses a fresh cache entry, but doesn't
+    fill the cache on a miss, since that would mean parsing everything
     """
     def __init__(self, **kwargs):
         path = kwargs.pop('path')
+        self._sentenceClass = CompactSentence if kwargs.pop('compact', False) else PTBSentence
+        cache = kwargs.pop('cache', None)
+        records = kwargs.pop('records', None)
+        lazy = kwargs.pop('lazy', False)
         if 'string' in kwargs:
             text = kwargs.pop('string')
+            cacheKey = dict(text=text, name=path)
         else:
-            text = open(path).read()
+            text = None
+            cacheKey = dict(sources=[path])
         # Sometimes sentences start (( instead of ( (. This is an error, correct it
         filename = path.split('/')[-1]
         self.path = path
@@ -27,74 +143,190 @@ class PTBFile(File, PTBNode):
         if self.filename.endswith('xml'):
             root_dir = os.path.dirname(os.path.dirname(path))
             self._parseNXT(root_dir, filename.split('.')[0])
-        else:
-            self._parseFile(text)
+            return
+        if records is not None:
+            self._attachCached(decodeSentences(records)[0])
+            return
+        if cache is not None and text is None:
+            cacheKey['stamp'] = cache.stamp([path])
+        cached = cache.load(**cacheKey) if cache is not None else None
+        if cached is not None:
+            self._attachCached(cached[0])
+            return
+        if text is None:
+            text = open(path).read()
+        if lazy:
+            self._indexFile(text)
+            return
+        self._parseFile(text)
+        if cache is not None:
+            cache.store(self.children(), **cacheKey)
+
+    def _attachCached(self, sentences):
+        for sentence in sentences:
+            if self._sentenceClass is not CompactSentence:
+                sentence = sentence.toSentence()
+            self.attachChild(sentence)
+
+    def toRecords(self):
+        """
+        Encode the sentences in marshallable form, for records=
+        """
+        return encodeSentences(self.children())
 
     def _parseFile(self, text):
-        currentSentence = []
-        for line in text.strip().split('\n'):
-            # Detect the start of sentences by line starting with (
-            # This is messy, but it keeps bracket parsing at the sentence level
-            if line.startswith('(') and currentSentence:
-                self._addSentence(currentSentence)
-                currentSentence = []
-            currentSentence.append(line)
-        self._addSentence(currentSentence)
-
-    def _addSentence(self, lines):
-        sentStr = '\n'.join(lines)[1:-1]
+        text = text.strip()
+        for start, end in sentenceSpans(text):
+            self._addSentence(text[start:end])
+
+    def _addSentence(self, sentStr):
+        sentStr = sentStr[1:-1]
         nSents = len(self)+1
         sentID = '%s~%s' % (self.filename, str(nSents).zfill(4))
-        self.attachChild(PTBSentence(string=sentStr, globalID=sentID, localID=self.length()))
+        self.attachChild(self._sentenceClass(string=sentStr, globalID=sentID,
+                                             localID=self.length()))
+
+    def _indexFile(self, text):
+        self._text = text.strip()
+        placeholders = []
+        for i, (start, end) in enumerate(sentenceSpans(self._text)):
+            sentID = '%s~%s' % (self.filename, str(i + 1).zfill(4))
+            placeholders.append(_Unparsed(start, end, sentID, i))
+        self._children = _LazySentences(placeholders, self._loadSentence)
+        self._IDDict = dict((p.globalID, p) for p in placeholders)
+
+    def _loadSentence(self, placeholder):
+        sentence = self._sentenceClass(string=self._text[placeholder.start + 1:placeholder.end - 1],
+                                       globalID=placeholder.globalID, localID=placeholder.localID)
+        self._IDDict[sentence.globalID] = sentence
+        return sentence
+
+    def sentence(self, key):
+        """
+        Retrieve a sentence by key
+        """
+        sentence = self._IDDict[key]
+        if type(sentence) is _Unparsed:
+            sentence = self._children[self._children.index(sentence)]
+        return sentence
+
+    def topLabel(self, index):
+        """
+        The label of the top constituent of the sentence at index, i.e.
+        child(index).child(0).label. Read from the text if the sentence
+        hasn't been parsed yet
+        """
+        if isinstance(self._children, _LazySentences) and not self._children.isParsed(index):
+            placeholder = list.__getitem__(self._children, index)
+            match = _topLabelRE.search(self._text, placeholder.start + 1, placeholder.end - 1)
+            if match:
+                return parseLabel(match.group(1))[0]
+        return self.child(index).child(0).label
 
 
 class NXTFile(File, PTBNode):
+    """
+    A Switchboard dialogue, read from the NXT terminals, syntax and turns
+    files of both speakers, or from its precompiled bundle if that is
+    up to date (see _NXTBundle) and bundle=False isn't given. Takes
+    compact=, cache= and records= like PTBFile
+    """
     def __init__(self, **kwargs):
         self.path = kwargs.pop('path')
         self.filename = kwargs.pop('filename')
+        self._sentenceClass = CompactSentence if kwargs.pop('compact', False) else PTBSentence
+        cache = kwargs.pop('cache', None)
+        records = kwargs.pop('records', None)
+        useBundle = kwargs.pop('bundle', True)
         self.ID = self.filename
         self._IDDict = {}
         PTBNode.__init__(self, label='File', **kwargs)
         self.xml_idx = {}
+        self._bundleStamp = None
+        if records is not None:
+            self._attachCached(*decodeSentences(records))
+            return
+        sources = self.sourcePaths(self.path, self.filename)
+        # Taken before the XML is read, for saveBundle() and the cache
+        self._bundleStamp = bundleStamp(sources)
+        stamp = cache.stamp(sources) if cache is not None else None
+        cached = readBundle(self.path, self.filename, sources) if useBundle else None
+        if cached is None and cache is not None:
+            cached = cache.load(sources=sources, stamp=stamp)
+        if cached is not None:
+            self._attachCached(*cached)
+            return
         self._parseNXT(self.path, self.filename)
         self._addTurns(self.path, self.filename)
+        if cache is not None:
+            cache.store(self.children(), extra=self._xmlKeys(), sources=sources, stamp=stamp)
+
+    def _xmlKeys(self):
+        """
+        The xml_idx keys of the sentences, in order
+        """
+        xmlKeys = dict((id(sent), key) for key, sent in self.xml_idx.items())
+        return [xmlKeys[id(s)] for s in self.children()]
+
+    def toRecords(self):
+        """
+        Encode the sentences in marshallable form, for records=
+        """
+        return encodeSentences(self.children(), self._xmlKeys())
+
+    def saveBundle(self):
+        """
+        Precompile the dialogue into its bundle, under <path>/bundle
+        """
+        writeBundle(self.path, self.filename, self.sourcePaths(self.path, self.filename),
+                    self.children(), self._xmlKeys(), self._bundleStamp)
+
+    @staticmethod
+    def sourcePaths(nxt_root_dir, file_id):
+        """
+        The XML files a dialogue is read from
+        """
+        return [os.path.join(nxt_root_dir, 'xml', layer, '%s.%s.%s.xml' % (file_id, speaker, layer))
+                for layer in ['terminals', 'syntax', 'turns'] for speaker in ['A', 'B']]
+
+    def _attachCached(self, sentences, xmlKeys):
+        for sentence, key in zip(sentences, xmlKeys):
+            if self._sentenceClass is not CompactSentence:
+                sentence = sentence.toSentence()
+            self.xml_idx[tuple(key)] = sentence
+            self.attachChild(sentence)
 
     def _parseNXT(self, nxt_root_dir, file_id):
         terminals = {}
         ns = '{http://nite.sourceforge.net/}'
         for speaker in ['A', 'B']:
-            # Get terminals
+            # Get terminals, all kinds in one pass
             terminals_loc = os.path.join(nxt_root_dir, 'xml', 'terminals',
                                         '%s.%s.terminals.xml' % (file_id, speaker))
-            leaves_tree = etree.parse(open(terminals_loc))
-            for w_xml in leaves_tree.iter('word'):
-                wordID = int(w_xml.get(ns+'id').split('_')[1]) - 1
-                w_node = PTBLeaf(label=w_xml.get('pos'), start_time=w_xml.get(ns+'start'),
-                                 end_time=w_xml.get(ns+'end'), text=w_xml.get('orth'),
-                                 wordID=wordID)
-                terminals[w_xml.get(ns+'id')] = w_node
-            for p_xml in leaves_tree.iter('punc'):
-                wordID = int(p_xml.get(ns+'id').split('_')[1]) - 1
-                terminals[p_xml.get(ns+'id')] = PTBLeaf(label=p_xml.text,
-                                                     text=p_xml.text,
-                                                     wordID=wordID)
-            for t_xml in leaves_tree.iter('trace'):
-                wordID = int(t_xml.get(ns+'id').split('_')[1]) - 1
-                terminals[t_xml.get(ns+'id')] = PTBLeaf(label='-NONE-', text='-NONE-',
-                                                     wordID=wordID)
-            for s_xml in leaves_tree.iter('sil'):
-                wordID = int(s_xml.get(ns+'id').split('_')[1]) - 1
-                terminals[s_xml.get(ns+'id')] = PTBLeaf(label='-NONE-', text='-SIL-',
-                                                        wordID=wordID)
+            for t_xml in _iterRootChildren(terminals_loc, _terminalTags):
+                xml_id = t_xml.get(ns+'id')
+                wordID = int(xml_id.split('_')[1]) - 1
+                tag = t_xml.tag
+                if tag == 'word':
+                    # Times are kept as strings until they are read
+                    leaf = PTBLeaf(label=t_xml.get('pos'), start_time=t_xml.get(ns+'start'),
+                                   end_time=t_xml.get(ns+'end'), text=t_xml.get('orth'),
+                                   wordID=wordID)
+                elif tag == 'punc':
+                    leaf = PTBLeaf(label=t_xml.text, text=t_xml.text, wordID=wordID)
+                elif tag == 'trace':
+                    leaf = PTBLeaf(label='-NONE-', text='-NONE-', wordID=wordID)
+                else:
+                    leaf = PTBLeaf(label='-NONE-', text='-SIL-', wordID=wordID)
+                terminals[xml_id] = leaf
                 
             syntax_loc = os.path.join(nxt_root_dir, 'xml', 'syntax',
                                       '%s.%s.syntax.xml' % (file_id, speaker))
-            syntax_tree = etree.parse(open(syntax_loc))
-            for s_xml in syntax_tree.iter('parse'):
+            for s_xml in _iterRootChildren(syntax_loc, ('parse',)):
                 localID = int(s_xml.get(ns+'id')[1:])
                 globalID = '%s~%s' % (file_id, str(localID).zfill(4))
-                ptb_sent = PTBSentence(xml_node=s_xml, terminals=terminals,
-                                       globalID=globalID, localID=localID)
+                ptb_sent = self._sentenceClass(xml_node=s_xml, terminals=terminals,
+                                               globalID=globalID, localID=localID)
                 self.xml_idx[(speaker, localID)] = ptb_sent
                 self.attachChild(ptb_sent)
             
@@ -106,14 +338,15 @@ class NXTFile(File, PTBNode):
             #     orth = p_xml.get('orth')
             # TODO: clean orth (non-trivial; is there a better way to get surface forms?)
         
-        self.sortChildren()
+        # Stable, like sortChildren, but on keys found while building
+        self._children.sort(key=_documentKey)
+        self._structureChanged()
 
     def _addTurns(self, path, filename):
         ns = '{http://nite.sourceforge.net/}'
         for speaker in ['A', 'B']:
             turns_loc = os.path.join(path, 'xml', 'turns', '%s.%s.turns.xml' % (filename, speaker))
-            turns_tree = etree.parse(open(turns_loc))
-            for turn_xml in turns_tree.iter('turn'):
+            for turn_xml in _iterRootChildren(turns_loc, ('turn',)):
                 child = turn_xml.getchildren()[0]
                 sent_ids = child.get('href').split('#')[1]
                 if '..' in sent_ids:
@@ -1,7 +1,9 @@
 from Treebank.Nodes import Leaf
 from _PTBNode import PTBNode
+from _Symbols import EDITED
 
 class PTBLeaf(Leaf, PTBNode):
+    __slots__ = ('wordID', 'text', 'synsets', 'supersenses', 'lemma')
     def __init__(self, **kwargs):
         self.wordID = kwargs.pop('wordID')
         self.text = kwargs.pop('text')
@@ -18,7 +20,7 @@ class PTBLeaf(Leaf, PTBNode):
     def isEdited(self):
         node = self.parent()
         while not node.isRoot():
-            if node.label == 'EDITED':
+            if node.label is EDITED:
                 return True
             node = node.parent()
         return False
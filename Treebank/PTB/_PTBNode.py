@@ -1,44 +1,47 @@
-import re
-import bisect
-
 from Treebank.Nodes import Node
+from _Symbols import symbols, parseLabel, _labelRE
+
+
+def _parseTime(time_str):
+    if time_str is None or time_str == 'n/a':
+        return None
+    elif time_str == 'non-aligned' or time_str == '?':
+        return -1
+    else:
+        return float(time_str)
 
 
 class PTBNode(Node):
     """
     A node in a parse tree
+
+    Times may be given as the strings found in the NXT files. They are
+    converted when first read, since most are never looked at
     """
-    _labelRE = re.compile(r'([^-=]+)(?:-([^-=\d]+))?(-UNF)?(?:-(\d+))?(?:=(\d+))?')
+    __slots__ = ('_start_time', '_end_time', 'functionLabel', 'identifier',
+                 'identified', 'unf', 'traced')
+    _labelRE = _labelRE
     def __init__(self, **kwargs):
-        def parse_time(time_str):
-            if time_str is None or time_str == 'n/a':
-                return None
-            elif time_str == 'non-aligned' or time_str == '?':
-                return -1
-            else:
-                return float(time_str)
-
         string = kwargs.pop('string', None)
         if string is not None:        
-            pieces = PTBNode._labelRE.match(string).groups()
-            label, functionLabel, unf, identifier, identified = pieces
+            label, functionLabel, unf, identifier, identified = parseLabel(string)
             start_time = None
             end_time = None
         else:
-            label = kwargs.pop('label')
-            functionLabel = kwargs.pop('functionLabel', None)
-            identifier = kwargs.pop('identifier', None)
-            identified = kwargs.pop('identified', None)
+            label = symbols.intern(kwargs.pop('label'))
+            functionLabel = symbols.intern(kwargs.pop('functionLabel', None))
+            identifier = symbols.intern(kwargs.pop('identifier', None))
+            identified = symbols.intern(kwargs.pop('identified', None))
             unf = kwargs.pop('unf', False)
-            start_time = parse_time(kwargs.pop('start_time', None))
-            end_time = parse_time(kwargs.pop('end_time', None))
+            start_time = kwargs.pop('start_time', None)
+            end_time = kwargs.pop('end_time', None)
         if kwargs:
             raise StandardError, kwargs
         if functionLabel == 'UNF':
             functionLabel = None
             unf = True
-        self.start_time = start_time
-        self.end_time = end_time
+        self._start_time = start_time
+        self._end_time = end_time
         self.functionLabel = functionLabel
         self.identifier = identifier
         self.identified = identified
@@ -47,6 +50,28 @@ class PTBNode(Node):
         self.traced = None
         Node.__init__(self, label)
 
+    def _getStartTime(self):
+        time = self._start_time
+        if isinstance(time, basestring):
+            time = self._start_time = _parseTime(time)
+        return time
+
+    def _setStartTime(self, time):
+        self._start_time = time
+
+    start_time = property(_getStartTime, _setStartTime)
+
+    def _getEndTime(self):
+        time = self._end_time
+        if isinstance(time, basestring):
+            time = self._end_time = _parseTime(time)
+        return time
+
+    def _setEndTime(self, time):
+        self._end_time = time
+
+    end_time = property(_getEndTime, _setEndTime)
+
     def duration(self):
         if self.start_time is None or self.end_time is None:
             return None
@@ -57,8 +82,9 @@ class PTBNode(Node):
     def gapAfter(self):
         if self.end_time < 0:
             return None
-        words = self.root().listWords()
-        idx = words.index(self.getWord(-1))
+        root = self.root()
+        words = root._wordYield()
+        idx = root.wordIndex(self.getWord(-1))
         if idx == len(words) - 1:
             return None
         else:
@@ -0,0 +1,42 @@
+"""
+Streaming reader for bracketed Penn Treebank text
+
+PTBFile reads a whole file and keeps all its sentences. readSentences
+works from any file-like object or iterable of lines instead (an open
+.mrg or .auto file, sys.stdin, a pipe from a parser), and builds one
+sentence at a time, so memory use doesn't grow with the input.
+"""
+from _PTBSentence import PTBSentence
+from _CompactSentence import CompactSentence
+
+
+def readSentences(lines, name='-', compact=False):
+    """
+    Generate the sentences in lines, with the same boundaries and IDs
+    (name~0001, name~0002...) as a PTBFile of the same text called name.
+    Only the current sentence's lines are held
+    """
+    sentenceClass = CompactSentence if compact else PTBSentence
+    current = []
+    localID = 0
+    for line in lines:
+        if line.endswith('\n'):
+            line = line[:-1]
+        if not current:
+            # Leading whitespace is stripped from the text as a whole
+            line = line.lstrip()
+            if not line:
+                continue
+        # Detect the start of sentences by line starting with (
+        elif line.startswith('('):
+            yield _makeSentence(sentenceClass, '\n'.join(current), name, localID)
+            localID += 1
+            current = []
+        current.append(line)
+    if current:
+        yield _makeSentence(sentenceClass, '\n'.join(current).rstrip(), name, localID)
+
+
+def _makeSentence(sentenceClass, text, name, localID):
+    sentID = '%s~%s' % (name, str(localID + 1).zfill(4))
+    return sentenceClass(string=text[1:-1], globalID=sentID, localID=localID)
@@ -4,13 +4,28 @@ from Treebank.Nodes import Sentence
 from _PTBNode import PTBNode
 from _PTBLeaf import PTBLeaf
 
+def _firstWordID(ids, nodes, firstWordIDs):
+    """
+    The word ID of the first leaf under the nodes with the given IDs, or
+    None if there are none. firstWordIDs holds the answer for internal nodes
+    """
+    for id_ in ids:
+        node = nodes[id_]
+        first = node.wordID if node.isLeaf() else firstWordIDs[id_]
+        if first is not None:
+            return first
+    return None
+
+
 class PTBSentence(PTBNode, Sentence):
     """
     The root of the parse tree
     
     Has no parent, and one or more children
     """
+    __slots__ = ('localID', 'speaker', 'turnID', '_documentKey')
     def __init__(self, **kwargs):
+        self._documentKey = None
         if 'string' in kwargs:
             node = self._parseString(kwargs.pop('string'))
         elif 'node' in kwargs:
@@ -28,55 +43,75 @@ class PTBSentence(PTBNode, Sentence):
 
     bracketsRE = re.compile(r'(\()([^\s\)\(]+)|([^\s\)\(]+)?(\))')
     def _parseString(self, sent_text):
-        openBrackets = []
-        parentage = {}
-        nodes = {}
+        """
+        Build the tree in one pass over the brackets. Nodes are made as
+        their brackets close, so children are complete by then, and
+        identifiers and traces are collected on the way
+        """
+        # Open brackets, as (label, preorder position, children)
+        stack = []
+        nOpened = 0
         nWords = 0
-        
-        # Get the nodes and record their parents
-        for match in self.bracketsRE.finditer(sent_text):
-            open_, label, text, close = match.groups()
+        top = None
+        topIndex = -1
+        identifiers = []
+        traces = []
+        for open_, label, text, close in self.bracketsRE.findall(sent_text):
             if open_:
-                assert not close
-                assert label
-                openBrackets.append((label, match.start()))
+                stack.append((label, nOpened, []))
+                nOpened += 1
+                continue
+            if not stack:
+                raise ValueError('Unbalanced brackets: %s' % sent_text)
+            label, index, children = stack.pop()
+            if text:
+                node = PTBLeaf(label=label, text=text, wordID=nWords)
+                nWords += 1
+                if children:
+                    node.attachChild(children[0])
             else:
-                assert close
-                label, start = openBrackets.pop()
-                if text:
-                    newNode = PTBLeaf(label=label, text=text, wordID=nWords)
-                    nWords += 1
-                else:
-                    newNode = PTBNode(string=label)
-                if openBrackets:
-                    # Store parent start position
-                    parentStart = openBrackets[-1][1]
-                    parentage[start] = parentStart
-                else:
-                    top = newNode
-                # Organise nodes by start
-                nodes[start] = newNode
-        try:
-            self._connectNodes(nodes, parentage)
-        except:
-            print sent_text
-            raise
-        by_identifier = dict((n.identifier, n) for n in top.depthList() if n.identifier)
-        for node in top.depthList():
+                node = PTBNode(string=label)
+                node._children = children
+                for child in children:
+                    child._parent = node
+            if node.identifier:
+                identifiers.append((index, node))
             if node.identified:
+                traces.append((index, node))
+            if stack:
+                stack[-1][2].append(node)
+            else:
+                top = node
+                topIndex = index
+        if top is None or any(children for label, index, children in stack):
+            raise ValueError('Unbalanced brackets: %s' % sent_text)
+        # Only top's descendants count, and the last identifier in
+        # preorder wins. Everything opened after top and closed is below it
+        by_identifier = {}
+        for index, node in sorted(identifiers):
+            if index > topIndex:
+                by_identifier[node.identifier] = node
+        for index, node in traces:
+            if index > topIndex:
                 node.traced = by_identifier.get(node.identified)
         return top
-        
+
     def _parseNXT(self, root, terminals):
+        """
+        Build the tree of an NXT parse element, with each node's children
+        in word order. Sets _documentKey, the first word ID of the sorted
+        tree, so that the file can order its sentences without walking them
+        """
         nodes = {}
         parentage = {}
         ns = '{http://nite.sourceforge.net/}'
-        parse_id = root.get(ns+'id')
+        nt_ids = []
         for xml_node in root.iter('nt'):
             id_ = xml_node.get(ns+'id')
             node = PTBNode(label=xml_node.get('cat'), start_time=xml_node.get(ns+'start'),
                            end_time=xml_node.get(ns+'end'))
             nodes[id_] = node
+            nt_ids.append(id_)
             for child in xml_node.getchildren():
                 if child.tag != 'nt':
                     continue
@@ -90,15 +125,34 @@ class PTBSentence(PTBNode, Sentence):
                 if node is not None and node.text != '-SIL-':
                     nodes[xml_id] = node
                     parentage[xml_id] = id_
-        self._connectNodes(nodes, parentage)
+        # Children start out in the order of their sorted IDs, as the
+        # generic _connectNodes would attach them
+        children = {}
+        for key in sorted(parentage):
+            children.setdefault(parentage[key], []).append(key)
+        # Each node's children are sorted on the first word ID of their
+        # subtree as it stood before sorting (0 if it has no words), which
+        # is what sorting the nodes top-down on sortKey() used to give.
+        # Work bottom-up, keeping for each node the first word ID before
+        # and after sorting. A nested nt always comes after its parent in
+        # the document, so reverse document order visits children first
+        unsortedFirst = {}
+        sortedFirst = {}
+        for id_ in reversed(nt_ids):
+            kids = children.get(id_, [])
+            unsortedFirst[id_] = _firstWordID(kids, nodes, unsortedFirst)
+            kids.sort(key=lambda kid: _firstWordID([kid], nodes, unsortedFirst) or 0)
+            sortedFirst[id_] = _firstWordID(kids, nodes, sortedFirst)
+            node = nodes[id_]
+            for kid in kids:
+                nodes[kid].setParent(node)
+            node._children = [nodes[kid] for kid in kids]
         for xml_node in root.getchildren():
             if xml_node.tag == 'nt':
-                top = nodes[xml_node.get(ns+'id')]
+                top_id = xml_node.get(ns+'id')
                 break
-        top.sortChildren()
-        for node in top.depthList():
-            node.sortChildren()
-        return top
+        self._documentKey = sortedFirst[top_id] or 0
+        return nodes[top_id]
 
     def addTurn(self, speaker, turnID):
         self.speaker = speaker
@@ -0,0 +1,114 @@
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from array import array
+
+from _CompactSentence import CompactSentence
+from _Symbols import symbols, SymbolTable
+
+# Bump when the record layout changes. The array item sizes and byte order
+# are part of the key too, since the arrays are stored in native form
+FORMAT_VERSION = 2
+_PLATFORM = (sys.byteorder, array('i').itemsize, marshal.version)
+
+
+def encodeSentences(sentences, extra=None):
+    """
+    Encode a file's sentences as a marshallable (strings, extra, records)
+    triple. Used for the cache entries, and to send parses between processes
+    """
+    strings = SymbolTable()
+    records = []
+    for sentence in sentences:
+        if not isinstance(sentence, CompactSentence):
+            sentence = CompactSentence(sentence=sentence)
+        records.append(sentence.toRecord(strings))
+    return [strings.string(i) for i in xrange(len(strings))], extra, records
+
+
+def decodeSentences(encoded):
+    """
+    Return (sentences, extra) from encodeSentences' output. The sentences
+    are CompactSentences
+    """
+    strings, extra, records = encoded
+    symbolIDs = [symbols.id(string) for string in strings]
+    return [CompactSentence.fromRecord(r, symbolIDs) for r in records], extra
+
+
+class ParseCache(object):
+    """
+    On-disk cache of parsed files
+
+    Each entry holds a file's sentences as CompactSentence records in one
+    marshal blob, along with the paths, modification times and sizes of
+    the sources it was parsed from. An entry is only used if all of those
+    still match. Text passed in directly (PTBFile's string=) is keyed by
+    its digest and a name instead, since sentence IDs come from the name.
+
+    Callers that parse the sources themselves should take stamp() before
+    reading them and pass it to load() and store(), so that a source that
+    changes during the parse isn't stored as its new version.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def stamp(self, sources):
+        """
+        The paths, modification times and sizes of the sources
+        """
+        stamp = []
+        for path in sources:
+            path = os.path.abspath(path)
+            stat = os.stat(path)
+            stamp.append((path, stat.st_mtime, stat.st_size))
+        return stamp
+
+    def load(self, sources=None, text=None, name=None, stamp=None):
+        """
+        Return (sentences, extra) for the sources or text, or None on a
+        miss. The sentences are CompactSentences
+        """
+        key, stamp = self._key(sources, text, name, stamp)
+        try:
+            with open(self._location(key), 'rb') as file_:
+                header, stored, encoded = marshal.load(file_)
+        except (IOError, EOFError, ValueError, TypeError):
+            self.misses += 1
+            return None
+        if header != (FORMAT_VERSION, _PLATFORM) or stored != stamp:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return decodeSentences(encoded)
+
+    def store(self, sentences, extra=None, sources=None, text=None, name=None, stamp=None):
+        """
+        Save a file's sentences. extra is any marshallable value the file
+        class wants back on load
+        """
+        key, stamp = self._key(sources, text, name, stamp)
+        blob = ((FORMAT_VERSION, _PLATFORM), stamp, encodeSentences(sentences, extra))
+        # Write then rename, so that concurrent readers never see half a file
+        handle, tmpLocation = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as file_:
+            marshal.dump(blob, file_, 2)
+        os.rename(tmpLocation, self._location(key))
+
+    def _key(self, sources, text, name, stamp):
+        if text is not None:
+            if isinstance(text, unicode):
+                text = text.encode('utf8')
+            return ('text', name, hashlib.sha1(text).hexdigest()), None
+        if stamp is None:
+            stamp = self.stamp(sources)
+        return ('sources', tuple(os.path.abspath(path) for path in sources)), stamp
+
+    def _location(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key)).hexdigest() + '.parse')
@@ -2,6 +2,11 @@ from Treebank.Nodes import Corpus
 from _PTBNode import PTBNode
 from _PTBFile import PTBFile
 from _PTBFile import NXTFile
+from _PTBSentence import PTBSentence
+from _CompactSentence import CompactSentence
+from _SentenceIndex import SentenceIndex
+from _PTBReader import readSentences
+from _SplitManifest import SplitManifest, wsjSection
 
 import os
 import sys
@@ -10,111 +15,159 @@ from os.path import join as pjoin
 class PennTreebank(PTBNode, Corpus):
     """
     The Penn Treebank, specifically the WSJ
-    Children are built just-in-time
+    Children are built just-in-time, and kept in an LRU cache if
+    cacheSize (files) or cacheBytes is given. parseCache (a ParseCache),
+    compact and lazy are passed on to the files. jobs > 1 parses files in
+    that many processes (see readInParallel)
+
+    The files are listed by a SplitManifest, with WSJ sections and the
+    Johnson and Charniak Switchboard splits, which splitFiles() selects
+    from. manifest may be a SplitManifest with other splits, or the
+    location of a saved one to load, or to create if it doesn't exist
     """
     fileClass = PTBFile
-    def __init__(self, path=None, **kwargs):
+    # Set by indexSentences
+    sentenceIndex = None
+    def __init__(self, path=None, cacheSize=None, cacheBytes=None, parseCache=None,
+                 compact=False, lazy=False, jobs=1, manifest=None, **kwargs):
         self.path = path
+        self.manifest = _getManifest(manifest, SplitManifest.scanPTB, path)
+        self.fileArgs = dict(cache=parseCache, compact=compact, lazy=lazy)
         PTBNode.__init__(self, label='Corpus', **kwargs)
-        for fileLoc in self._getFileList(self.path):
-            self.attachChild(fileLoc)
+        if cacheSize is not None or cacheBytes is not None:
+            self.cacheFiles(maxEntries=cacheSize, maxBytes=cacheBytes)
+        if jobs > 1:
+            self.readInParallel(jobs)
+        for row in self.manifest.rows:
+            self.attachChild(row.path)
                             
+    def indexSentences(self, location):
+        """
+        Keep a SentenceIndex of the corpus at location, building or
+        refreshing it as needed, so that sentence() and sentenceList()
+        parse just the sentences asked for. Returns the index
+        """
+        self.sentenceIndex = SentenceIndex(location)
+        self.sentenceIndex.update(self._children)
+        return self.sentenceIndex
+
+    def _sentencesInFile(self, filename, keys):
+        if self.sentenceIndex is None:
+            return Corpus._sentencesInFile(self, filename, keys)
+        located = [self.sentenceIndex.locate(key) for key in keys]
+        path = located[0][0]
+        # Sentences of a file that is already in memory are shared with it
+        if self.fileCache is not None and path in self.fileCache:
+            file_ = self.file(path)
+            return [file_.sentence(key) for key in keys]
+        sentenceClass = CompactSentence if self.fileArgs.get('compact') else PTBSentence
+        parsed = {}
+        with open(path, 'rb') as file_:
+            for key, (path, offset, length, localID) in sorted(zip(keys, located),
+                                                                key=lambda item: item[1][1]):
+                if key in parsed:
+                    continue
+                file_.seek(offset)
+                text = file_.read(length)
+                sentID = '%s~%s' % (filename, str(localID + 1).zfill(4))
+                parsed[key] = sentenceClass(string=text[1:-1], globalID=sentID, localID=localID)
+        return [parsed[key] for key in keys]
+
+    def sentences(self):
+        """
+        Generate every sentence in the corpus. Files are streamed, so only
+        one sentence is held at a time, unless files are cached or read in
+        parallel, in which case whole files are read as usual
+        """
+        if self.fileCache is not None or self.fileArgs.get('cache') or self.jobs > 1:
+            for sentence in Corpus.sentences(self):
+                yield sentence
+            return
+        for path in self._children:
+            print >> sys.stderr, path
+            with open(path) as file_:
+                for sentence in readSentences(file_, name=os.path.basename(path),
+                                              compact=self.fileArgs.get('compact')):
+                    yield sentence
+
     def section(self, sec):
-        for i, fileLoc in enumerate(self._children):
-            path, fileName = os.path.split(fileLoc)
-            if int(fileName[4:6]) == sec:
-                yield self.child(i)
+        return self._readChildren(self._sectionIndices(sec))
 
     def section00(self):
-        for i in xrange(99):
-            yield self.child(i)
+        return self.section(0)
 
     def twoTo21(self):
-        for i in xrange(199, 2074):
-            yield self.child(i)
+        return self._readChildren(self._sectionIndices(*range(2, 22)))
 
     def section23(self):
-        for i in xrange(2157, 2257):
-            yield self.child(i)
+        return self.section(23)
 
     def section24(self):
-        for i in xrange(2257, self.length()):
-            yield self.child(i)
+        return self.section(24)
+
+    def _sectionIndices(self, *secs):
+        # By file ID rather than split, so that sections work whatever
+        # splits the manifest has
+        secs = set('%02d' % sec for sec in secs)
+        return [i for i, row in enumerate(self.manifest.rows) if wsjSection(row.fileID) in secs]
 
     def _getFileList(self, location):
         """
         Get all files below location
         """
-        paths = []
-        for path in [pjoin(location, f) for f in os.listdir(location)]:
-            if path.endswith('CVS'):
-                continue
-            elif path.startswith('.'):
-                continue
-            if os.path.isdir(path):
-                paths.extend(self._getFileList(path))
-            elif path.endswith('.mrg') or path.endswith('.auto'):
-                paths.append(path)
-        paths.sort()
-        return paths
+        return SplitManifest.scanPTB(location).paths()
 
 
 class NXTSwitchboard(PTBNode, Corpus):
-    """The Nite XML-toolkite formatted Switchboard spoken language treebank"""
+    """
+    The Nite XML-toolkite formatted Switchboard spoken language treebank
+    Takes the same options as PennTreebank. The manifest's splits are the
+    Johnson and Charniak ones by default
+    """
     fileClass = NXTFile
-    def __init__(self, path=None, **kwargs):
+    def __init__(self, path=None, cacheSize=None, cacheBytes=None, parseCache=None,
+                 compact=False, jobs=1, manifest=None, **kwargs):
         self.path = path
+        self.manifest = _getManifest(manifest, SplitManifest.scanNXT, pjoin(path, 'xml', 'syntax'))
+        self.fileArgs = dict(cache=parseCache, compact=compact)
         PTBNode.__init__(self, label='Corpus', **kwargs)
-        for filename in self._getFileList(self.path):
-            self.attachChild(filename)
+        if cacheSize is not None or cacheBytes is not None:
+            self.cacheFiles(maxEntries=cacheSize, maxBytes=cacheBytes)
+        if jobs > 1:
+            self.readInParallel(jobs)
+        for row in self.manifest.rows:
+            self.attachChild(row.fileID)
 
     def attachChild(self, filename):
         self._children.append(filename)
             
-    def child(self, index):
-        """
-        Read a file by zero-index offset
-        """
-        filename = self._children[index]
-        print >> sys.stderr, filename
-        return self.fileClass(path=self.path, filename=filename)
+    def _fileKwargs(self, filename):
+        kwargs = dict(self.fileArgs)
+        kwargs.update(path=self.path, filename=filename)
+        return kwargs
  
     def _getFileList(self, location):
-        location = pjoin(location, 'xml', 'syntax')
-        files = set() 
-        for path in [f for f in os.listdir(location)]:
-            if path.startswith('.'):
-                continue
-            elif path.startswith('CVS'):
-                continue
-            assert path.endswith('xml'), path
-            filename = path.split('/')[-1]
-            fileID = filename.split('.')[0]
-            files.add(fileID)
-        files = list(files)
-        files.sort()
-        return files
+        return [row.fileID for row in SplitManifest.scanNXT(pjoin(location, 'xml', 'syntax')).rows]
 
     def train_files(self):
-        for i, f in enumerate(self._children):
-            if f.startswith('sw2') or f.startswith('sw3'):
-                yield self.child(i)
+        return self.splitFiles('train')
 
     def dev_files(self):
-        for i, f in enumerate(self._children):
-            filenum = int(f[2:])
-            if 4500 < filenum <= 4936:
-                yield self.child(i)
+        return self.splitFiles('dev')
  
     def dev2_files(self):
-        for i, f in enumerate(self._children):
-            filenum = int(f[2:])
-            if 4154 < filenum < 4500:
-                yield self.child(i)
+        # Narrower than the manifest's dev2, which takes every file
+        # outside the other splits
+        return self._readChildren([i for i in self.manifest.indices('dev2')
+                                   if 4154 < int(self._children[i][2:]) < 4500])
 
     def eval_files(self):
-        for i, f in enumerate(self._children):
-            filenum = int(f[2:])
-            if 4000 < filenum <= 4154:
-                yield self.child(i)
+        return self.splitFiles('test')
+
 
+def _getManifest(manifest, scan, root):
+    if manifest is None:
+        return scan(root)
+    elif isinstance(manifest, basestring):
+        return SplitManifest.cached(manifest, scan, root)
+    return manifest
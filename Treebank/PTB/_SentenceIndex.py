@@ -0,0 +1,102 @@
+import marshal
+import os
+import tempfile
+
+from _PTBFile import sentenceSpans
+
+# Bump when the layout of the index file changes
+INDEX_VERSION = 1
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+
+class SentenceIndex(object):
+    """
+    Persistent map from sentence keys (e.g. sw2005.mrg~0042) to the
+    position of the sentence in its .mrg file
+
+    Each file's entry holds its path, modification time and size, and
+    the byte offset and length of every sentence. Sentence IDs follow
+    from position in the file, so they aren't stored. Entries whose file
+    has changed are rebuilt when looked up or updated.
+    """
+    def __init__(self, location):
+        self.location = location
+        self._files = {}
+        try:
+            with open(location, 'rb') as file_:
+                version, files = marshal.load(file_)
+        except (IOError, EOFError, ValueError, TypeError):
+            return
+        if version == INDEX_VERSION:
+            self._files = files
+
+    def update(self, paths):
+        """
+        Index the files among paths that are new or have changed, drop
+        files that are no longer listed, and save if anything changed
+        """
+        changed = False
+        filenames = set()
+        for path in paths:
+            filename = os.path.basename(path)
+            filenames.add(filename)
+            entry = self._files.get(filename)
+            if entry is None or entry[0] != path or entry[1] != _stamp(path):
+                self._indexFile(path)
+                changed = True
+        for filename in set(self._files) - filenames:
+            del self._files[filename]
+            changed = True
+        if changed:
+            self.save()
+
+    def _indexFile(self, path):
+        stamp = _stamp(path)
+        with open(path, 'rb') as file_:
+            text = file_.read()
+        stripped = text.lstrip()
+        leading = len(text) - len(stripped)
+        spans = sentenceSpans(stripped.rstrip())
+        self._files[os.path.basename(path)] = (path, stamp,
+                                               [(leading + start, end - start) for start, end in spans])
+
+    def locate(self, key):
+        """
+        Return (path, offset, length, localID) for a sentence key. Raises
+        KeyError for keys of unknown files or past the end of their file
+        """
+        filename, number = key.split('~')
+        path, stamp, spans = self._files[filename]
+        if _stamp(path) != stamp:
+            self._indexFile(path)
+            self.save()
+            path, stamp, spans = self._files[filename]
+        localID = int(number) - 1
+        if not 0 <= localID < len(spans):
+            raise KeyError(key)
+        offset, length = spans[localID]
+        return path, offset, length, localID
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.location))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Write then rename, so that concurrent readers never see half a file
+        handle, tmpLocation = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as file_:
+            marshal.dump((INDEX_VERSION, self._files), file_, 2)
+        os.rename(tmpLocation, self.location)
+
+    def __contains__(self, key):
+        try:
+            self.locate(key)
+        except (KeyError, ValueError, OSError):
+            return False
+        return True
+
+    def __len__(self):
+        return sum(len(spans) for path, stamp, spans in self._files.values())
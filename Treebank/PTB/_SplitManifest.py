@@ -0,0 +1,241 @@
+"""
+Train/dev/test splits of the treebanks
+
+A SplitManifest lists a corpus's files once, as (file ID, path, size,
+split) rows, and indexes them by split, so that selecting a split never
+rescans directories or parses anything. Manifests are saved as TSV,
+with a header noting the root, splitter and a stamp of the directories
+they were made from, so that a stale one is rescanned.
+
+Splits come from a function of the file ID. The standard ones are the
+WSJ sections ('00' to '24') and the Johnson and Charniak (2004) division
+of Switchboard: train below sw4000, test up to sw4154, dev from sw4501
+to sw4936 and dev2 for everything else. kFold() relabels a manifest
+into folds.
+"""
+import os
+from collections import namedtuple
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+ManifestRow = namedtuple('ManifestRow', ['fileID', 'path', 'size', 'split'])
+
+
+def wsjSection(fileID):
+    """
+    The section of a WSJ file, e.g. '02' for wsj_0201
+    """
+    return fileID[4:6]
+
+
+def johnsonCharniak(fileID):
+    """
+    The Johnson and Charniak split of a Switchboard file, e.g. sw4100
+    """
+    filenum = int(fileID[2:6])
+    if filenum < 4000:
+        return 'train'
+    elif 4000 < filenum <= 4154:
+        return 'test'
+    elif 4500 < filenum <= 4936:
+        return 'dev'
+    else:
+        return 'dev2'
+
+
+def standardSplit(fileID):
+    """
+    WSJ section for WSJ files, Johnson and Charniak split for Switchboard
+    """
+    if fileID.startswith('wsj_'):
+        return wsjSection(fileID)
+    elif fileID.startswith('sw') and fileID[2:6].isdigit():
+        return johnsonCharniak(fileID)
+    return None
+
+
+def _walk(directory):
+    """
+    Generate (path, size) for the files below directory, skipping CVS
+    and hidden entries. Uses scandir where available, to avoid a stat
+    per entry
+    """
+    if scandir is not None:
+        entries = sorted((entry.name, entry) for entry in scandir(directory))
+        for name, entry in entries:
+            if name.startswith('.') or name == 'CVS':
+                continue
+            if entry.is_dir():
+                for item in _walk(entry.path):
+                    yield item
+            else:
+                yield entry.path, entry.stat().st_size
+        return
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('.') or name == 'CVS':
+            continue
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            for item in _walk(path):
+                yield item
+        else:
+            yield path, os.path.getsize(path)
+
+
+def _source(root, splitter):
+    """
+    What a saved manifest was made from: the root, the splitter's name, and
+    a stamp of the number of entries below root and the latest directory
+    modification time. Directories are listed but files aren't stat'ed
+    """
+    count = 0
+    mtime = 0
+    for directory, dirnames, filenames in os.walk(root):
+        count += len(dirnames) + len(filenames)
+        mtime = max(mtime, os.path.getmtime(directory))
+    name = '%s.%s' % (splitter.__module__, splitter.__name__)
+    return (os.path.abspath(root), name, '%d:%r' % (count, mtime))
+
+
+class SplitManifest(object):
+    """
+    The files of a corpus and their splits, in corpus order
+    """
+    # (root, splitter, stamp) of a manifest saved by cached()
+    source = None
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self._byID = {}
+        self._bySplit = {}
+        for i, row in enumerate(self.rows):
+            self._byID[row.fileID] = i
+            self._bySplit.setdefault(row.split, []).append(i)
+
+    @classmethod
+    def scanPTB(cls, location, splitter=standardSplit):
+        """
+        List the .mrg and .auto files below location, sorted by path
+        """
+        rows = []
+        for path, size in _walk(location):
+            if path.endswith('.mrg') or path.endswith('.auto'):
+                fileID = os.path.basename(path).rsplit('.', 1)[0]
+                rows.append(ManifestRow(fileID, path, size, splitter(fileID)))
+        rows.sort(key=lambda row: row.path)
+        return cls(rows)
+
+    @classmethod
+    def scanNXT(cls, syntaxDir, splitter=standardSplit):
+        """
+        List the dialogues with syntax files in syntaxDir (<NXT root>/xml/syntax),
+        sorted by ID. The path is that of speaker A's syntax file, and the
+        size counts both speakers
+        """
+        sizes = {}
+        for path, size in _walk(syntaxDir):
+            assert path.endswith('xml'), path
+            fileID = os.path.basename(path).split('.')[0]
+            sizes[fileID] = sizes.get(fileID, 0) + size
+        return cls(ManifestRow(fileID, os.path.join(syntaxDir, '%s.A.syntax.xml' % fileID),
+                               sizes[fileID], splitter(fileID))
+                   for fileID in sorted(sizes))
+
+    @classmethod
+    def cached(cls, location, scan, root, splitter=standardSplit):
+        """
+        Load the manifest saved at location, or make one with scan(root,
+        splitter) and save it there. The saved one is rescanned if it was
+        made from another root or splitter, or files have been added or
+        removed below root since
+        """
+        source = _source(root, splitter)
+        if os.path.exists(location):
+            manifest = cls.load(location)
+            if manifest.source == source:
+                return manifest
+        manifest = scan(root, splitter)
+        # Create the file before taking the stamp, in case it's below root.
+        # Rewriting it doesn't change its directory
+        open(location, 'a').close()
+        manifest.source = _source(root, splitter)
+        manifest.save(location)
+        return manifest
+
+    @classmethod
+    def load(cls, location):
+        rows = []
+        source = None
+        with open(location) as file_:
+            for line in file_:
+                fields = line.rstrip('\n').split('\t')
+                if fields[0] == '#':
+                    source = tuple(fields[1:])
+                    continue
+                fileID, path, size, split = fields
+                rows.append(ManifestRow(fileID, path, int(size), split or None))
+        manifest = cls(rows)
+        manifest.source = source
+        return manifest
+
+    def save(self, location):
+        with open(location, 'w') as file_:
+            if self.source is not None:
+                file_.write('#\t%s\n' % '\t'.join(self.source))
+            for row in self.rows:
+                file_.write('%s\t%s\t%d\t%s\n' % (row.fileID, row.path, row.size,
+                                                   row.split or ''))
+
+    def relabel(self, splitter):
+        """
+        A copy of the manifest with splits from splitter(fileID)
+        """
+        return SplitManifest(row._replace(split=splitter(row.fileID)) for row in self.rows)
+
+    def kFold(self, k):
+        """
+        A copy of the manifest with the files dealt in order into splits
+        'fold0' to 'fold<k-1>'
+        """
+        return SplitManifest(row._replace(split='fold%d' % (i % k))
+                             for i, row in enumerate(self.rows))
+
+    def indices(self, *splits):
+        """
+        Positions of the files in any of the splits, in corpus order. All
+        files if no split is given
+        """
+        if not splits:
+            return range(len(self.rows))
+        if len(splits) == 1:
+            return list(self._bySplit.get(splits[0], []))
+        found = []
+        for split in splits:
+            found.extend(self._bySplit.get(split, []))
+        found.sort()
+        return found
+
+    def files(self, *splits):
+        return [self.rows[i] for i in self.indices(*splits)]
+
+    def paths(self, *splits):
+        return [self.rows[i].path for i in self.indices(*splits)]
+
+    def split(self, fileID):
+        return self.rows[self._byID[fileID]].split
+
+    def splits(self):
+        return sorted(split for split in self._bySplit if split is not None)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, fileID):
+        return fileID in self._byID
@@ -0,0 +1,78 @@
+import re
+
+
+class SymbolTable(object):
+    """
+    Per-process table of label, function label and POS strings
+
+    The vocabulary is tiny, so every node can share one copy of each
+    string. Byte strings, and ASCII unicode ones converted to bytes, go
+    through the builtin intern(), which makes them the same objects as
+    identical string literals in the code, so labels can be compared by
+    identity. Each symbol also gets a small integer id, for array storage;
+    id 0 is None.
+    """
+    def __init__(self):
+        self._interned = {}
+        self._strings = [None]
+        self._ids = {None: 0}
+
+    def intern(self, string):
+        if string is None:
+            return None
+        try:
+            return self._interned[string]
+        except KeyError:
+            # Unicode labels (from the NXT XML) become the same str objects
+            # as byte-string ones, so identity checks work on them too
+            if type(string) is unicode:
+                try:
+                    string = string.encode('ascii')
+                except UnicodeEncodeError:
+                    pass
+            symbol = intern(string) if type(string) is str else string
+            self._interned[symbol] = symbol
+            return symbol
+
+    def id(self, string):
+        try:
+            return self._ids[string]
+        except KeyError:
+            symbol = self.intern(string)
+            self._ids[symbol] = len(self._strings)
+            self._strings.append(symbol)
+            return self._ids[symbol]
+
+    def string(self, id_):
+        return self._strings[id_]
+
+    def __len__(self):
+        return len(self._strings)
+
+symbols = SymbolTable()
+
+EDITED = symbols.intern('EDITED')
+TRACE = symbols.intern('-NONE-')
+
+
+_labelRE = re.compile(r'([^-=]+)(?:-([^-=\d]+))?(-UNF)?(?:-(\d+))?(?:=(\d+))?')
+_parsedLabels = {}
+
+def parseLabel(string):
+    """
+    Split a bracketed label like NP-SBJ-1 into (label, functionLabel, unf,
+    identifier, identified), with the strings interned. Memoised, since
+    the same few hundred labels are parsed over and over
+    """
+    try:
+        return _parsedLabels[string]
+    except KeyError:
+        pass
+    label, functionLabel, unf, identifier, identified = _labelRE.match(string).groups()
+    if functionLabel == 'UNF':
+        functionLabel = None
+        unf = True
+    parsed = (symbols.intern(label), symbols.intern(functionLabel), bool(unf),
+              symbols.intern(identifier), symbols.intern(identified))
+    _parsedLabels[string] = parsed
+    return parsed
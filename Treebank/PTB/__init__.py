@@ -1,9 +1,16 @@
+from _Symbols import SymbolTable, symbols, parseLabel, EDITED, TRACE
 from _PTBNode import PTBNode
 from _PTBSentence import PTBSentence
 from _PTBLeaf import PTBLeaf
+from _CompactSentence import CompactSentence
+from _CompactSentence import CompactNode
 from _TracedNode import TracedNode
 from _PTBFile import PTBFile
 from _PTBFile import NXTFile
+from _ParseCache import ParseCache
+from _SentenceIndex import SentenceIndex
+from _PTBReader import readSentences
+from _SplitManifest import SplitManifest, standardSplit, wsjSection, johnsonCharniak
 from _PennTreebank import PennTreebank
 from _PennTreebank import NXTSwitchboard
 
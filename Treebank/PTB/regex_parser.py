@@ -0,0 +1,53 @@
+"""
+The bracket parser PTBSentence used before _parseString, kept as a
+reference for the tests and bin/bench_parser.py to check and time the
+current one against
+"""
+from _PTBSentence import PTBSentence
+from _PTBNode import PTBNode
+from _PTBLeaf import PTBLeaf
+
+
+def parseStringRegex(sentence, sent_text):
+    """
+    Parse sent_text as PTBSentence._parseString does, by keying the
+    nodes on offset and connecting them afterwards with sentence
+    """
+    openBrackets = []
+    parentage = {}
+    nodes = {}
+    nWords = 0
+    
+    # Get the nodes and record their parents
+    for match in PTBSentence.bracketsRE.finditer(sent_text):
+        open_, label, text, close = match.groups()
+        if open_:
+            assert not close
+            assert label
+            openBrackets.append((label, match.start()))
+        else:
+            assert close
+            label, start = openBrackets.pop()
+            if text:
+                newNode = PTBLeaf(label=label, text=text, wordID=nWords)
+                nWords += 1
+            else:
+                newNode = PTBNode(string=label)
+            if openBrackets:
+                # Store parent start position
+                parentStart = openBrackets[-1][1]
+                parentage[start] = parentStart
+            else:
+                top = newNode
+            # Organise nodes by start
+            nodes[start] = newNode
+    try:
+        sentence._connectNodes(nodes, parentage)
+    except:
+        print sent_text
+        raise
+    by_identifier = dict((n.identifier, n) for n in top.depthList() if n.identifier)
+    for node in top.depthList():
+        if node.identified:
+            node.traced = by_identifier.get(node.identified)
+    return top
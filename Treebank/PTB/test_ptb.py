@@ -1,8 +1,54 @@
 import unittest
 import os.path
 import os
+import shutil
+import tempfile
 
+import Treebank.Nodes
 import Treebank.PTB
+from Treebank.PTB.regex_parser import parseStringRegex
+
+SWBD_SAMPLE = """( (CODE (SYM SpeakerA1) (. .) ))
+( (S (NP-SBJ-1 (PRP I) )
+    (VP (VBP think)
+      (SBAR (-NONE- 0)
+        (S (EDITED (RM (-DFL- \\[) )
+              (NP-SBJ (PRP it) )
+              (, ,)
+              (IP (-DFL- \\+) ))
+          (NP-SBJ (PRP it) )
+          (RS (-DFL- \\]) )
+          (VP (VBZ 's)
+            (ADJP-PRD (JJ good) )))))
+    (. .) (-DFL- E_S) ))
+( (SQ-UNF (VBP do) (NP-SBJ (PRP you) ) (VP-UNF (VB kn-) ) (, ,) (-DFL- N_S) ))
+( (S (NP-SBJ-4 (PRP it) ) (VP (VBD was) (ADJP-PRD (JJ good) (S (-NONE- *ICH*-4) ) )) (. .) ))
+"""
+
+NXT_NS = 'xmlns:nite="http://nite.sourceforge.net/"'
+NXT_SAMPLE = {
+    'terminals': """<nite:root {ns}>
+<word nite:id="s1_1" nite:start="0.000" nite:end="0.250" pos="UH" orth="yeah"/>
+<punc nite:id="s1_2">.</punc>
+<word nite:id="s2_1" nite:start="0.500" nite:end="non-aligned" pos="UH" orth="uh"/>
+<sil nite:id="s2_2"/>
+</nite:root>""",
+    'syntax': """<nite:root {ns}>
+<parse nite:id="s1"><nt nite:id="s1_500" cat="INTJ" nite:start="0.000" nite:end="0.250"><nite:child href="sw2005.{speaker}.terminals.xml#id(s1_2)"/><nite:child href="sw2005.{speaker}.terminals.xml#id(s1_1)"/></nt></parse>
+<parse nite:id="s2"><nt nite:id="s2_500" cat="INTJ" nite:start="0.500" nite:end="0.750"><nite:child href="sw2005.{speaker}.terminals.xml#id(s2_1)"/><nite:child href="sw2005.{speaker}.terminals.xml#id(s2_2)"/></nt></parse>
+</nite:root>""",
+    'turns': """<nite:root {ns}>
+<turn nite:id="t1"><nite:child href="sw2005.{speaker}.syntax.xml#id(s1)..id(s2)"/></turn>
+</nite:root>"""}
+
+
+def write_nxt_sample(root):
+    for layer, text in NXT_SAMPLE.items():
+        os.makedirs(os.path.join(root, 'xml', layer))
+        for speaker in 'AB':
+            with open(os.path.join(root, 'xml', layer, 'sw2005.%s.%s.xml' % (speaker, layer)), 'w') as file_:
+                file_.write(text.format(ns=NXT_NS, speaker=speaker))
+
 
 class TestPTB(unittest.TestCase):
     def test_corpus(self):
@@ -13,6 +59,514 @@ class TestPTB(unittest.TestCase):
         self.assertEqual(41, len(asbestos.listWords()))
 
 
+class TestCompactSentence(unittest.TestCase):
+    def setUp(self):
+        self.full = Treebank.PTB.PTBFile(path='sw2005.mrg', string=SWBD_SAMPLE)
+        self.compact = Treebank.PTB.PTBFile(path='sw2005.mrg', string=SWBD_SAMPLE,
+                                            compact=True)
+
+    def test_words(self):
+        for full, compact in zip(self.full.children(), self.compact.children()):
+            self.assertEqual([(w.text, w.wordID, w.label) for w in full.listWords()],
+                             [(w.text, w.wordID, w.label) for w in compact.listWords()])
+
+    def test_structure(self):
+        for full, compact in zip(self.full.children(), self.compact.children()):
+            self.assertEqual([n.label for n in full.depthList()],
+                             [n.label for n in compact.depthList()])
+            self.assertEqual([n.label for n in full.breadthList()],
+                             [n.label for n in compact.breadthList()])
+            self.assertEqual([n.parent().label for n in full.depthList()],
+                             [n.parent().label for n in compact.depthList()])
+            self.assertEqual(str(full), str(compact))
+
+    def test_file_walks(self):
+        self.assertEqual([n.label for n in self.full.depthList()],
+                         [n.label for n in self.compact.depthList()])
+        self.assertEqual([n.label for n in self.full.breadthList()],
+                         [n.label for n in self.compact.breadthList()])
+
+    def test_node_view(self):
+        sent = self.compact.child(1)
+        word = sent.listWords()[4]
+        self.assertEqual(word.text, 'it')
+        self.assertTrue(word.isEdited())
+        self.assertEqual(word.parent().functionLabel, 'SBJ')
+        self.assertEqual(word.parent().parent().getWordID(0), 3)
+        self.assertEqual(word.root(), sent)
+        self.assertTrue(self.compact.child(2).child(0).unf)
+
+    def test_traces(self):
+        ich = self.compact.child(3).listWords()[-2]
+        self.assertEqual(ich.traced.label, 'NP')
+        self.assertEqual(ich.traced.identifier, '4')
+
+    def test_to_sentence(self):
+        for full, compact in zip(self.full.children(), self.compact.children()):
+            rebuilt = compact.toSentence()
+            self.assertEqual(str(full), str(rebuilt))
+            self.assertEqual(full.globalID, rebuilt.globalID)
+
+
+class TestWordYield(unittest.TestCase):
+    def setUp(self):
+        ptb_file = Treebank.PTB.PTBFile(path='sw2005.mrg', string=SWBD_SAMPLE)
+        self.sent = ptb_file.child(1)
+
+    def test_memo_invalidated_by_prune(self):
+        sent = self.sent
+        self.assertEqual(len(sent.listWords()), 13)
+        edited = [n for n in sent.depthList() if n.label == 'EDITED'][0]
+        vp = edited.parent()
+        self.assertEqual(vp.span(), (3, 10))
+        edited.prune()
+        self.assertEqual(len(sent.listWords()), 9)
+        self.assertEqual(vp.span(), (7, 10))
+        self.assertEqual(vp.getWord(0).text, 'it')
+
+    def test_memo_invalidated_by_reattach(self):
+        sent = self.sent
+        words = sent.listWords()
+        period = words[11]
+        period.reattach(words[0].parent())
+        self.assertEqual([w.text for w in sent.listWords()][:3], ['I', '.', 'think'])
+        self.assertEqual(sent.wordIndex(period), 1)
+        self.assertEqual(period.parent().getWordID(-1), 11)
+
+    def test_listWords_returns_copy(self):
+        words = self.sent.listWords()
+        words.pop()
+        self.assertEqual(len(self.sent.listWords()), 13)
+
+
+class TestTraversal(unittest.TestCase):
+    def setUp(self):
+        sent_str = '(S (NP (DT the) (NN dog)) (VP (VBD barked)))'
+        self.sent = Treebank.PTB.PTBSentence(string=sent_str, globalID='x~0001',
+                                             localID=0)
+
+    def test_orders(self):
+        labels = lambda nodes: ' '.join(n.label for n in nodes)
+        self.assertEqual(labels(self.sent.depthList()), 'S NP DT NN VP VBD')
+        self.assertEqual(labels(self.sent.breadthList()), 'S NP VP DT NN VBD')
+        self.assertEqual(labels(Treebank.Nodes.postorder(self.sent)), 'DT NN NP VBD VP S')
+        self.assertEqual(labels(Treebank.Nodes.iterLeaves(self.sent)), 'DT NN VBD')
+
+    def test_prune_during_iteration(self):
+        for node in Treebank.Nodes.iterPreorder(self.sent):
+            if node.label == 'NP':
+                node.prune()
+        self.assertEqual([w.text for w in self.sent.listWords()], ['barked'])
+
+
+class TestOrdering(unittest.TestCase):
+    def test_attach_by_position(self):
+        sent_str = '(S (NP (DT the) (NN dog)) (VP (VBD barked)) (. .))'
+        sent = Treebank.PTB.PTBSentence(string=sent_str, globalID='x~0001', localID=0)
+        top = sent.child(0)
+        vp = top.child(1)
+        vp.prune()
+        top.attachChild(vp)
+        self.assertEqual([n.label for n in top.children()], ['NP', 'VP', '.'])
+        self.assertEqual(vp.sortKey(), 2)
+
+    def test_sort_children(self):
+        sent_str = '(S (NP (DT the) (NN dog)) (VP (VBD barked)))'
+        sent = Treebank.PTB.PTBSentence(string=sent_str, globalID='x~0001', localID=0)
+        top = sent.child(0)
+        np = top.child(0)
+        np.prune()
+        top.attachChild(np, len(top))
+        self.assertEqual(top.getWord(0).text, 'barked')
+        top.sortChildren()
+        self.assertEqual([w.text for w in sent.listWords()], ['the', 'dog', 'barked'])
+
+
+class TestSymbols(unittest.TestCase):
+    def test_parse_label(self):
+        self.assertEqual(Treebank.PTB.parseLabel('NP-SBJ-1'), ('NP', 'SBJ', False, '1', None))
+        self.assertEqual(Treebank.PTB.parseLabel('VP-UNF'), ('VP', None, True, None, None))
+        self.assertEqual(Treebank.PTB.parseLabel('NP=2'), ('NP', None, False, None, '2'))
+
+    def test_labels_interned(self):
+        ptb_file = Treebank.PTB.PTBFile(path='sw2005.mrg', string=SWBD_SAMPLE)
+        edited = [n for n in ptb_file.child(1).depthList() if n.label == 'EDITED']
+        self.assertTrue(edited[0].label is Treebank.PTB.EDITED)
+        subjects = [n.functionLabel for s in ptb_file.children() for n in s.depthList()
+                    if n.functionLabel == 'SBJ']
+        self.assertTrue(all(label is subjects[0] for label in subjects))
+        label = ''.join(['NN', 'S'])
+        self.assertTrue(Treebank.PTB.symbols.intern(label) is 'NNS')
+        # Unicode labels map to the same str, whichever is seen first
+        self.assertTrue(Treebank.PTB.symbols.intern(u'EDITED') is Treebank.PTB.EDITED)
+        fresh = Treebank.PTB.symbols.intern(u'UNSEEN-LABEL')
+        self.assertEqual(type(fresh), str)
+        self.assertTrue(Treebank.PTB.symbols.intern('UNSEEN-LABEL') is fresh)
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for name in ['sw2005.mrg', 'sw2006.mrg', 'sw2007.mrg']:
+            with open(os.path.join(self.root, name), 'w') as file_:
+                file_.write(SWBD_SAMPLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_lru(self):
+        corpus = Treebank.PTB.PennTreebank(path=self.root, cacheSize=2)
+        first = corpus.child(0)
+        self.assertTrue(corpus.child(0) is first)
+        corpus.child(1)
+        corpus.child(2)
+        self.assertFalse(corpus.child(0) is first)
+        self.assertEqual(corpus.fileCache.stats(), {'entries': 2, 'bytes': 0, 'hits': 1,
+                                                    'misses': 4, 'evictions': 2})
+
+    def test_byte_bound(self):
+        corpus = Treebank.PTB.PennTreebank(path=self.root)
+        cache = corpus.cacheFiles(maxBytes=1)
+        corpus.child(0)
+        corpus.child(1)
+        self.assertEqual(len(cache), 1)
+        self.assertTrue(cache.bytes > 1)
+        self.assertEqual(cache.evictions, 1)
+        cache.clear()
+        self.assertEqual(cache.stats(), {'entries': 0, 'bytes': 0, 'hits': 0, 'misses': 0,
+                                         'evictions': 0})
+
+    def test_lazy_size(self):
+        corpus = Treebank.PTB.PennTreebank(path=self.root, lazy=True)
+        cache = corpus.cacheFiles(maxBytes=10 ** 6)
+        file_ = corpus.child(0)
+        self.assertTrue(cache.bytes > 0)
+        self.assertFalse(any(file_._children.isParsed(i) for i in xrange(file_.length())))
+
+
+class TestCorpusWalk(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for name in ['sw2005.mrg', 'sw2006.mrg']:
+            with open(os.path.join(self.root, name), 'w') as file_:
+                file_.write(SWBD_SAMPLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_walks(self):
+        corpus = Treebank.PTB.PennTreebank(path=self.root)
+        files = list(corpus.children())
+        nodes = corpus.depthList()
+        self.assertEqual([n.label for n in nodes],
+                         [n.label for f in files for n in [f] + f.depthList()])
+        self.assertEqual(sorted(n.label for n in corpus.breadthList()),
+                         sorted(n.label for n in nodes))
+        self.assertEqual([f.ID for f in corpus.breadthList()[:2]], ['sw2005.mrg', 'sw2006.mrg'])
+        self.assertEqual([w.text for w in corpus.listWords()],
+                         [w.text for f in files for w in f.listWords()])
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'sw2005.mrg')
+        with open(self.path, 'w') as file_:
+            file_.write(SWBD_SAMPLE)
+        self.cache = Treebank.PTB.ParseCache(os.path.join(self.root, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_round_trip(self):
+        parsed = Treebank.PTB.PTBFile(path=self.path, cache=self.cache)
+        cached = Treebank.PTB.PTBFile(path=self.path, cache=self.cache)
+        compact = Treebank.PTB.PTBFile(path=self.path, cache=self.cache, compact=True)
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+        for sents in zip(parsed.children(), cached.children(), compact.children()):
+            self.assertEqual(len(set(str(s) for s in sents)), 1)
+            self.assertEqual(len(set(s.globalID for s in sents)), 1)
+        ich = cached.child(3).listWords()[-2]
+        self.assertEqual(ich.traced.identifier, '4')
+        self.assertTrue(ich.label is Treebank.PTB.TRACE)
+
+    def test_stale(self):
+        Treebank.PTB.PTBFile(path=self.path, cache=self.cache)
+        with open(self.path, 'a') as file_:
+            file_.write('( (S (INTJ (UH Yeah) ) (. .) ))\n')
+        reparsed = Treebank.PTB.PTBFile(path=self.path, cache=self.cache)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(reparsed.length(), 5)
+
+    def test_changed_while_parsing(self):
+        parseFile = Treebank.PTB.PTBFile._parseFile
+        def parseAndAppend(file_, text):
+            parseFile(file_, text)
+            with open(self.path, 'a') as out:
+                out.write('( (S (INTJ (UH Yeah) ) (. .) ))\n')
+        Treebank.PTB.PTBFile._parseFile = parseAndAppend
+        try:
+            Treebank.PTB.PTBFile(path=self.path, cache=self.cache)
+        finally:
+            Treebank.PTB.PTBFile._parseFile = parseFile
+        # The entry has the stamp of the text that was parsed
+        reparsed = Treebank.PTB.PTBFile(path=self.path, cache=self.cache)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(reparsed.length(), 5)
+
+
+class TestLazyFile(unittest.TestCase):
+    def setUp(self):
+        self.eager = Treebank.PTB.PTBFile(string=SWBD_SAMPLE, path='sw2005.mrg')
+        self.lazy = Treebank.PTB.PTBFile(string=SWBD_SAMPLE, path='sw2005.mrg', lazy=True)
+
+    def test_parse_on_demand(self):
+        sentences = self.lazy._children
+        self.assertEqual(self.lazy.length(), self.eager.length())
+        self.assertEqual(self.lazy.topLabel(0), 'CODE')
+        self.assertEqual(self.lazy.topLabel(2), 'SQ')
+        self.assertFalse(any(sentences.isParsed(i) for i in range(self.lazy.length())))
+        self.assertEqual(str(self.lazy.child(2)), str(self.eager.child(2)))
+        self.assertEqual([sentences.isParsed(i) for i in range(4)], [False, False, True, False])
+        sentence = self.lazy.sentence('sw2005.mrg~0002')
+        self.assertEqual(sentence.localID, 1)
+        self.assertTrue(sentence is self.lazy.child(1))
+
+    def test_same_as_eager(self):
+        self.assertEqual([str(s) for s in self.lazy.children()],
+                         [str(s) for s in self.eager.children()])
+        self.assertEqual([s.globalID for s in self.lazy.children()],
+                         [s.globalID for s in self.eager.children()])
+        self.assertEqual(len(self.lazy.depthList()), len(self.eager.depthList()))
+
+
+class TestTimes(unittest.TestCase):
+    def test_lazy_conversion(self):
+        node = Treebank.PTB.PTBNode(label='NP', start_time='1.500', end_time='non-aligned')
+        self.assertEqual(node._start_time, '1.500')
+        self.assertEqual(node.start_time, 1.5)
+        self.assertEqual(node._start_time, 1.5)
+        self.assertEqual(node.end_time, -1)
+        self.assertEqual(node.duration(), None)
+        node.end_time = '2.0'
+        self.assertEqual(node.duration(), 0.5)
+        self.assertEqual(Treebank.PTB.PTBNode(label='NP', start_time='n/a').start_time, None)
+
+
+class TestParser(unittest.TestCase):
+    def check_same(self, text):
+        sent = Treebank.PTB.PTBSentence(string=text, globalID='x~0001', localID=0)
+        new, old = sent._parseString(text), parseStringRegex(sent, text)
+        self.assertEqual(new.prettyPrint(), old.prettyPrint())
+        new_nodes, old_nodes = new.depthList(), old.depthList()
+        positions = dict((id(n), i) for i, n in enumerate(new_nodes))
+        old_positions = dict((id(n), i) for i, n in enumerate(old_nodes))
+        self.assertEqual([positions.get(id(n.traced)) for n in new_nodes],
+                         [old_positions.get(id(n.traced)) for n in old_nodes])
+        return new
+
+    def test_sample(self):
+        text = SWBD_SAMPLE.strip()
+        for start, end in Treebank.PTB._PTBFile.sentenceSpans(text):
+            self.check_same(text[start + 1:end - 1])
+
+    def test_unbalanced(self):
+        self.assertRaises(ValueError, Treebank.PTB.PTBSentence, string='(S (NP (NN x))',
+                          globalID='x~0001', localID=0)
+        self.assertRaises(ValueError, Treebank.PTB.PTBSentence, string=' (S (NN x)))',
+                          globalID='x~0001', localID=0)
+
+    def test_duplicate_identifiers(self):
+        # The last identifier in preorder wins, and the top node is ignored
+        top = self.check_same(' (S-1 (NP-1 (NN a) ) (VP (NP-1 (NN b) ) (NP=1 (-NONE- *T*) )))')
+        self.assertEqual(top.child(1).child(1).traced.getWord(0).text, 'b')
+
+
+class TestReader(unittest.TestCase):
+    text = '\n*x* Copyright (C) 1990 *x*\n\n' + SWBD_SAMPLE + '\n\n'
+
+    def test_same_as_file(self):
+        ptb_file = Treebank.PTB.PTBFile(string=self.text, path='sw2005.mrg')
+        from StringIO import StringIO
+        streamed = list(Treebank.PTB.readSentences(StringIO(self.text), name='sw2005.mrg'))
+        self.assertEqual([(s.globalID, s.localID, str(s)) for s in streamed],
+                         [(s.globalID, s.localID, str(s)) for s in ptb_file.children()])
+
+    def test_lines(self):
+        sentences = Treebank.PTB.readSentences(iter(self.text.split('\n')), compact=True)
+        first = next(sentences)
+        self.assertEqual(first.globalID, '-~0001')
+        self.assertTrue(isinstance(first, Treebank.PTB.CompactSentence))
+        self.assertEqual(len(list(sentences)), 4)
+
+
+class TestSentenceIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for name in ['sw2005.mrg', 'sw2010.mrg']:
+            with open(os.path.join(self.root, name), 'w') as file_:
+                file_.write('\n\n' + SWBD_SAMPLE)
+        self.location = os.path.join(self.root, 'index', 'sentences')
+        self.corpus = Treebank.PTB.PennTreebank(path=self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_lookup(self):
+        index = self.corpus.indexSentences(self.location)
+        self.assertEqual(len(index), 8)
+        file_ = self.corpus.child(1)
+        keys = ['sw2010.mrg~0003', 'sw2005.mrg~0001', 'sw2010.mrg~0002', 'sw2010.mrg~0003']
+        sentences = self.corpus.sentenceList(keys)
+        self.assertEqual([s.globalID for s in sentences], keys)
+        self.assertEqual([str(s) for s in sentences],
+                         [str(file_.sentence(key.replace('sw2005', 'sw2010'))) for key in keys])
+        self.assertEqual(sentences[0].localID, 2)
+        self.assertTrue(sentences[0] is sentences[3])
+        self.assertRaises(KeyError, self.corpus.sentence, 'sw2010.mrg~0005')
+
+    def test_persistence(self):
+        self.corpus.indexSentences(self.location)
+        index = Treebank.PTB.SentenceIndex(self.location)
+        self.assertTrue('sw2005.mrg~0004' in index)
+        path = os.path.join(self.root, 'sw2005.mrg')
+        with open(path, 'w') as file_:
+            file_.write(SWBD_SAMPLE.split('\n( (S')[0])
+        # The next mtime tick may not have come yet
+        os.utime(path, (0, 0))
+        self.assertFalse('sw2005.mrg~0002' in index)
+        self.assertEqual(self.corpus.sentence('sw2005.mrg~0001').child(0).label, 'CODE')
+
+
+class TestParallelRead(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        sentences = SWBD_SAMPLE.strip().split('\n( ')
+        for i in range(5):
+            # Vary the files, so that misordering would show
+            text = '\n( '.join(sentences[:i + 1])
+            with open(os.path.join(self.root, 'sw20%02d.mrg' % i), 'w') as file_:
+                file_.write(text.rstrip() + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_same_as_serial(self):
+        serial = Treebank.PTB.PennTreebank(path=self.root)
+        parallel = Treebank.PTB.PennTreebank(path=self.root, jobs=2)
+        parallel.readInParallel(2, chunkSize=2, readAhead=1)
+        expected = [(f.ID, [str(s) for s in f.children()]) for f in serial.children()]
+        got = [(f.ID, [str(s) for s in f.children()]) for f in parallel.children()]
+        self.assertEqual(got, expected)
+        self.assertEqual([f.ID for f in parallel.section(0)], ['sw2000.mrg'])
+        parallel.close()
+
+    def test_file_cache(self):
+        corpus = Treebank.PTB.PennTreebank(path=self.root, jobs=2, cacheSize=10)
+        first = list(corpus.children())
+        second = list(corpus.children())
+        self.assertTrue(all(a is b for a, b in zip(first, second)))
+        self.assertEqual(corpus.fileCache.hits, 5)
+        corpus.close()
+
+    def test_one_pool(self):
+        corpus = Treebank.PTB.PennTreebank(path=self.root, jobs=2)
+        pool = corpus._pool
+        list(corpus.splitFiles('train'))
+        list(corpus.children())
+        self.assertTrue(corpus._pool is pool)
+        corpus.close()
+        self.assertEqual(corpus._pool, None)
+        self.assertEqual(len(list(corpus.children())), 5)
+
+
+class TestSplitManifest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for name in ['sw2005', 'sw4100', 'sw4600', 'sw4200', 'wsj_2301']:
+            with open(os.path.join(self.root, name + '.mrg'), 'w') as file_:
+                file_.write(SWBD_SAMPLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_splits(self):
+        manifest = Treebank.PTB.SplitManifest.scanPTB(self.root)
+        self.assertEqual([row.fileID for row in manifest.rows],
+                         ['sw2005', 'sw4100', 'sw4200', 'sw4600', 'wsj_2301'])
+        self.assertEqual(manifest.splits(), ['23', 'dev', 'dev2', 'test', 'train'])
+        self.assertEqual(manifest.split('sw4600'), 'dev')
+        self.assertEqual(manifest.indices('dev2', 'train'), [0, 2])
+        self.assertEqual(manifest.files('test')[0].size, len(SWBD_SAMPLE))
+        folds = manifest.kFold(2)
+        self.assertEqual(folds.indices('fold1'), [1, 3])
+
+    def test_saved(self):
+        location = os.path.join(self.root, 'manifest.tsv')
+        corpus = Treebank.PTB.PennTreebank(path=self.root, manifest=location)
+        self.assertEqual([f.ID for f in corpus.splitFiles('test', 'dev')],
+                         ['sw4100.mrg', 'sw4600.mrg'])
+        self.assertEqual([f.ID for f in corpus.section23()], ['wsj_2301.mrg'])
+        loaded = Treebank.PTB.SplitManifest.load(location)
+        self.assertEqual(loaded.rows, corpus.manifest.rows)
+        # A saved manifest is used as it is while nothing changes...
+        scan = Treebank.PTB.SplitManifest.scanPTB
+        fail = lambda root, splitter: self.fail('rescanned')
+        self.assertEqual(Treebank.PTB.SplitManifest.cached(location, fail, self.root).rows,
+                         loaded.rows)
+        # ...and rescanned when files go, or the splitter changes
+        os.remove(os.path.join(self.root, 'sw2005.mrg'))
+        corpus = Treebank.PTB.PennTreebank(path=self.root, manifest=location)
+        self.assertEqual(corpus.length(), 4)
+        relabelled = Treebank.PTB.SplitManifest.cached(location, scan, self.root,
+                                                       Treebank.PTB.wsjSection)
+        self.assertEqual(relabelled.split('sw4100'), '00')
+
+
+class TestNXTBundle(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        write_nxt_sample(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read(self, **kwargs):
+        file_ = Treebank.PTB.NXTFile(path=self.root, filename='sw2005', **kwargs)
+        return [(s.globalID, s.speaker, s.turnID, str(s), [w.end_time for w in s.listWords()])
+                for s in file_.children()]
+
+    def test_round_trip(self):
+        from Treebank.PTB._NXTBundle import bundlePath, isFresh
+        parsed = self.read()
+        self.assertEqual(len(parsed), 4)
+        sources = Treebank.PTB.NXTFile.sourcePaths(self.root, 'sw2005')
+        os.utime(sources[0], (1000, 1000))
+        Treebank.PTB.NXTFile(path=self.root, filename='sw2005').saveBundle()
+        location = bundlePath(self.root, 'sw2005')
+        self.assertTrue(isFresh(self.root, 'sw2005', sources))
+        # Spoil the XML, to show that the bundle is what gets read
+        size = os.path.getsize(sources[0])
+        with open(sources[0], 'w') as file_:
+            file_.write('x' * size)
+        os.utime(sources[0], (1000, 1000))
+        self.assertEqual(self.read(), parsed)
+        self.assertEqual(self.read(compact=True), parsed)
+        os.utime(sources[0], (0, 0))
+        self.assertFalse(isFresh(self.root, 'sw2005', sources))
+        self.assertTrue(os.path.exists(location))
+
+    def test_changed_before_saving(self):
+        from Treebank.PTB._NXTBundle import isFresh
+        sources = Treebank.PTB.NXTFile.sourcePaths(self.root, 'sw2005')
+        file_ = Treebank.PTB.NXTFile(path=self.root, filename='sw2005', bundle=False)
+        with open(sources[0], 'a') as out:
+            out.write('\n')
+        # The bundle holds the XML as it was read, so it is already stale
+        file_.saveBundle()
+        self.assertFalse(isFresh(self.root, 'sw2005', sources))
+
+
 class TestNXT(unittest.TestCase):
     def test_file(self):
         path = '/usr/local/data/NXT-Switchboard/'
@@ -5,6 +5,7 @@ import xml.etree.cElementTree as etree
 import os.path
 import os
 import plac
+from Treebank.PTB import SplitManifest, johnsonCharniak
 
 
 class Token(object):
@@ -93,26 +94,10 @@ def split_files(terminals_dir, syntax_dir):
                 os.path.join(syntax_dir, syn_b)
             )
 
-    train = []
-    dev = []
-    dev2 = []
-    test = []
-    for filename in os.listdir(syntax_dir):
-        if filename == 'CVS': continue
-        filenum, speaker, _ = filename.split('.', 2)
-        if speaker != 'A':
-            continue
-        filenum = int(filenum[2:])
-        locs = get_locs(filenum, terminals_dir, syntax_dir)
-        if filenum < 4000:
-            train.append(locs)
-        elif 4000 < filenum <= 4154:
-            test.append(locs)
-        elif 4500 < filenum <= 4936:
-            dev.append(locs)
-        else:
-            dev2.append(locs)
-    return train, dev, dev2, test
+    manifest = SplitManifest.scanNXT(syntax_dir, splitter=johnsonCharniak)
+    return [[get_locs(int(row.fileID[2:]), terminals_dir, syntax_dir)
+             for row in manifest.files(split)]
+            for split in ('train', 'dev', 'dev2', 'test')]
 
 
 def main(terms_dir, syntax_dir, out_dir):
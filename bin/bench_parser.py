@@ -0,0 +1,60 @@
+"""Time the bracket parser against the previous one on real .mrg files.
+
+    python bin/bench_parser.py /usr/local/data/Penn3/parsed/mrg/swbd/
+    python bin/bench_parser.py /usr/local/data/Penn3/parsed/mrg/wsj/
+
+Reads every sentence below the given directory, parses each with
+PTBSentence._parseString and with the old parseStringRegex, checks that
+the two trees print identically and have the same traces, and prints the
+time per sentence for each.
+"""
+import time
+
+import plac
+from Treebank.PTB import PTBSentence, PennTreebank
+from Treebank.PTB._PTBFile import sentenceSpans
+from Treebank.PTB.regex_parser import parseStringRegex
+
+
+def read_sentences(location):
+    texts = []
+    for path in PennTreebank(path=location)._children:
+        text = open(path).read().strip()
+        texts.extend(text[start + 1:end - 1] for start, end in sentenceSpans(text))
+    return texts
+
+
+def trace_signature(top):
+    nodes = [top] + top.depthList()
+    positions = dict((id(node), i) for i, node in enumerate(nodes))
+    return [positions.get(id(node.traced)) for node in nodes]
+
+
+def time_parser(parse, texts):
+    start = time.time()
+    for text in texts:
+        parse(text)
+    return time.time() - start
+
+
+@plac.annotations(
+    location=("Directory of .mrg files", "positional"),
+    repeats=("Timing repeats", "option", "r", int),
+)
+def main(location, repeats=3):
+    texts = read_sentences(location)
+    # Neither parser touches the sentence itself, so one will do for both
+    sent = PTBSentence(string='(S (NN x))', globalID='bench~0001', localID=0)
+    for text in texts:
+        new, old = sent._parseString(text), parseStringRegex(sent, text)
+        assert new.prettyPrint() == old.prettyPrint(), text
+        assert trace_signature(new) == trace_signature(old), text
+    print '%d sentences from %s: output identical' % (len(texts), location)
+    for name, parse in [('_parseString', sent._parseString),
+                        ('parseStringRegex', lambda text: parseStringRegex(sent, text))]:
+        best = min(time_parser(parse, texts) for _ in xrange(repeats))
+        print '%-18s %8.1fus/sentence %8.2fs total' % (name, best / len(texts) * 1e6, best)
+
+
+if __name__ == '__main__':
+    plac.call(main)
@@ -0,0 +1,118 @@
+"""Time depthList, breadthList and the word yield on synthetic trees.
+
+Builds deep (one long spine), wide (fixed branching) and flat (everything
+under the root) trees of growing size, and prints the time per node for the
+traversal engine and, with -l, for the old insert-based depthList. The
+per-node time of the new code should stay flat as the trees grow; the old
+code's grows with tree size on flat trees.
+"""
+import time
+
+import plac
+from Treebank.Nodes import Node, Leaf, Sentence, leaves
+
+
+class BenchLeaf(Leaf):
+    def __init__(self, wordID):
+        Leaf.__init__(self, 'NN')
+        self.wordID = wordID
+        self.text = 'w%d' % wordID
+
+
+def deep_tree(n_nodes):
+    """A spine of n_nodes internal nodes, each with one leaf beside it.
+    Built bottom-up, so each attachment only touches the new parent."""
+    node = BenchLeaf(n_nodes)
+    for i in xrange(n_nodes - 1, -1, -1):
+        parent = Node('X')
+        parent.attachChild(BenchLeaf(i), 0)
+        parent.attachChild(node, 1)
+        node = parent
+    sent = Sentence('S')
+    sent.attachChild(node, 0)
+    return sent
+
+
+def wide_tree(n_nodes, branching=10):
+    """Complete n-ary tree, filled breadth-first until n_nodes internal
+    nodes exist, with a leaf under each node of the last level"""
+    sent = Sentence('S')
+    frontier = [sent]
+    n = 0
+    while n < n_nodes:
+        next_frontier = []
+        for parent in frontier:
+            for _ in xrange(branching):
+                if n == n_nodes:
+                    break
+                child = Node('X')
+                parent.attachChild(child, len(parent))
+                next_frontier.append(child)
+                n += 1
+        frontier = next_frontier
+    for i, parent in enumerate(frontier):
+        parent.attachChild(BenchLeaf(i), 0)
+    return sent
+
+
+def flat_tree(n_nodes):
+    """n_nodes preterminals directly under the root, like the sentences of a
+    long dialogue under its file"""
+    sent = Sentence('S')
+    for i in xrange(n_nodes):
+        child = Node('X')
+        child.attachChild(BenchLeaf(i), 0)
+        sent.attachChild(child, i)
+    return sent
+
+
+def legacy_depth_list(node):
+    """The insert-based depthList this benchmark was written against"""
+    queue = list(node.children())
+    i = 0
+    for node in queue:
+        i += 1
+        if not node.isLeaf():
+            for j, child in enumerate(node.children()):
+                queue.insert(i+j, child)
+    return queue
+
+
+def best_time(function, arg, repeats):
+    times = []
+    for _ in xrange(repeats):
+        start = time.time()
+        function(arg)
+        times.append(time.time() - start)
+    return min(times)
+
+
+@plac.annotations(
+    max_size=("Largest tree, in nodes", "option", "n", int),
+    repeats=("Timing repeats per measurement", "option", "r", int),
+    legacy=("Also time the old depthList", "flag", "l"),
+)
+def main(max_size=128000, repeats=3, legacy=False):
+    sizes = []
+    size = 1000
+    while size <= max_size:
+        sizes.append(size)
+        size *= 2
+    print '%-5s %8s %8s %14s %14s %14s %14s' % ('shape', 'nodes', 'visited',
+        'depthList', 'breadthList', 'leaves', 'old depthList')
+    for shape, build in [('deep', deep_tree), ('wide', wide_tree), ('flat', flat_tree)]:
+        for size in sizes:
+            sent = build(size)
+            visited = len(sent.depthList())
+            timings = [best_time(lambda s: s.depthList(), sent, repeats),
+                       best_time(lambda s: s.breadthList(), sent, repeats),
+                       # listWords is memoised, so time the walk behind it
+                       best_time(leaves, sent, repeats)]
+            if legacy:
+                timings.append(best_time(legacy_depth_list, sent, 1))
+            per_node = ['%11.3fus' % (t / visited * 1e6) for t in timings]
+            print '%-5s %8d %8d %s' % (shape, size, visited, ' '.join('%14s' % t for t in per_node))
+
+
+if __name__ == '__main__':
+    plac.call(main)
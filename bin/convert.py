@@ -19,11 +19,16 @@ Further processing:
                      from it.
     - conll_to_dps.py: Produce .dps files from CoNLL format.
 """
+import multiprocessing
 import re
-import fabric.api
+import sys
 from pathlib import Path
 import plac
-from Treebank.PTB import PTBFile
+from Treebank.PTB import PTBFile, ParseCache, EDITED, SplitManifest, johnsonCharniak
+from Treebank.PTB._PTBFile import sentenceSpans
+from Treebank.Converter import ConverterPool, javaCommand, standInCommand, STANFORD_BASIC
+from Treebank.Converter import convertGroups, ConversionCache, converterFingerprint, runConverter
+from Treebank.Converter import pipeline, BuildManifest, atomicOpen, fileDigest
 
 
 PUNCT = set([',', ':', '.', ';', 'RRB', 'LRB', '``', "''"])
@@ -182,29 +187,10 @@ class Sentence(object):
 def divide_files(swbd_loc):
     """Divide data into train/dev/test/dev2 split following Johnson and Charniak
     division"""
-    swbd_loc = str(Path(swbd_loc).join('parsed').join('mrg').join('swbd'))
-    train = []
-    test = []
-    dev = []
-    dev2 = []
-    files = []
-    # pathlib's just a convenient path-handling library. os/os.path suck
-    files.extend(str(f) for f in Path(swbd_loc).join('2'))
-    files.extend(str(f) for f in Path(swbd_loc).join('3'))
-    files.extend(str(f) for f in Path(swbd_loc).join('4'))
- 
-    for filename in files:
-        if not filename.endswith('.mrg'): continue
-        filenum = int(filename[-8:-4])
-        if filenum < 4000:
-            train.append(filename)
-        elif 4000 < filenum <= 4154:
-            test.append(filename)
-        elif 4500 < filenum <= 4936:
-            dev.append(filename)
-        else:
-            dev2.append(filename)
-    return train, test, dev, dev2
+    swbd_loc = str(Path(swbd_loc).joinpath('parsed', 'mrg', 'swbd'))
+    manifest = SplitManifest.scanPTB(swbd_loc, splitter=johnsonCharniak)
+    return (manifest.paths('train'), manifest.paths('test'), manifest.paths('dev'),
+            manifest.paths('dev2'))
 
 
 def preprocess_mrg(mrg_str):
@@ -214,15 +200,15 @@ def preprocess_mrg(mrg_str):
     return '\n'.join(lines)
 
 
-def get_edited_yields(mrg_str):
-    ptb_file = PTBFile(string=mrg_str, path='/tmp/tmp')
+def get_edited_yields(mrg_str, cache=None):
+    ptb_file = PTBFile(string=mrg_str, path='/tmp/tmp', cache=cache)
     edits = []
     for sent in ptb_file.children():
         under_edit = set([])
         words = [w for w in sent.listWords() if not w.isTrace()]
         word_id = dict((w.wordID, i) for i, w in enumerate(words))
         for node in sent.breadthList():
-            if node.label != 'EDITED':
+            if node.label is not EDITED:
                 continue
             for word in node.listWords():
                 if not word.isTrace():
@@ -231,64 +217,183 @@ def get_edited_yields(mrg_str):
     return edits
 
 
-def convert_to_conll(mrg_str, name):
-    """Run the Stanford dependency converter over the mrg file, via the temp
-    files /tmp/*.mrg and /tmp/*.dep"""
-    loc = '/tmp/%s.mrg' % name[:-4]
-    out_loc = '/tmp/%s.dep' % name[:-4] 
-    open(loc, 'w').write(mrg_str)
-    cmd = 'java -mx800m -cp "./*:" ' + \
-           'edu.stanford.nlp.trees.EnglishGrammaticalStructure ' + \
-              '-treeFile "{mrg_loc}" -basic -makeCopulaHead -conllx > {out_loc}'
-    # Fabric just gives a nice context-manager for "cd" here
-    with fabric.api.lcd('stanford_converter/'):
-        # And a nice way to just run something --- I hate subprocess...
-        fabric.api.local(cmd.format(mrg_loc=loc, out_loc=out_loc))
-    return Path(out_loc).open().read()
+def split_trees(mrg_txt):
+    """The file's trees, as strings, for the converter"""
+    mrg_txt = mrg_txt.strip()
+    return [mrg_txt[start:end] for start, end in sentenceSpans(mrg_txt)]
+
+
+def convert_to_conll(mrg_str, pool=None, memo=None):
+    """Run the Stanford dependency converter over the mrg file, piping the
+    trees through it, or with the converters in pool. Trees in memo aren't
+    converted again"""
+    return convert_trees(split_trees(mrg_str), pool=pool, memo=memo)
+
+
+def convert_trees(trees, pool=None, memo=None):
+    if memo is not None:
+        return memo.convert(trees, lambda misses: convert_trees(misses, pool=pool))
+    if pool is not None:
+        return pool.convert(trees)
+    return run_converter(trees)
+
 
+def run_converter(trees):
+    """Pipe the trees through a one-off run of the converter"""
+    cmd = ['java', '-mx800m', '-cp', './*:'] + STANFORD_BASIC
+    return runConverter(cmd, trees, cwd='stanford_converter/')
 
-def do_section(locs, out_dir, name):
+
+def read_mrg(f):
+    mrg_txt = open(f).read()
+    if f == Path(f).parts[-1] == 'sw2065.mrg':
+        mrg_txt = fix_bracket_err(mrg_txt)
+    return preprocess_mrg(mrg_txt)
+
+
+def do_section(locs, out_dir, name, cache=None, pool=None, batch_files=0, memo=None):
+    write_section(section_results(locs, cache, pool, batch_files, memo), out_dir, name)
+
+
+def write_section(results, out_dir, name):
+    """Write each file's (raw_conll, conll, pos, txt) text, in order"""
     out_dir = Path(out_dir)
-    raw = out_dir.join('%s.raw_conll' % name).open('w')
-    conll = out_dir.join('%s.conll' % name).open('w')
-    pos = out_dir.join('%s.pos' % name).open('w')
-    txt = out_dir.join('%s.txt' % name).open('w')
-    for f in locs:
-        mrg_txt = open(f).read()
-        if f == Path(f).parts[-1] == 'sw2065.mrg':
-            mrg_txt = fix_bracket_err(mrg_txt)
-        mrg_txt = preprocess_mrg(mrg_txt)
-        edits = get_edited_yields(mrg_txt)
-        dep_txt = convert_to_conll(mrg_txt, Path(f).parts[-1])
-        raw.write(dep_txt)
-        # Now use sentence objects
-        sents = [Sentence(s) for s in dep_txt.strip().split('\n\n')]
-        dps_toks = _read_dps(_get_dps_loc(f))
-        dep_txt = []
-        assert len(sents) == len(edits)
-        tok_id = 0
-        for i, sent in enumerate(sents):
-            sent.add_edits(edits[i])
-            tok_id = sent.add_dps(tok_id, dps_toks)
-            sent.rm_tokens(lambda token: token.pos == '-DFL-')
-            sent.rm_tokens(lambda token: token.pos == 'XX')
-            sent.rm_tokens(lambda token: token.word[-1] == '-')
-            sent.rm_tokens(lambda token: token.pos in PUNCT)
-            sent.rm_tokens(lambda token: token.word.lower() in UHS)
-            sent.lower_case()
-            sent.merge_mwe('you_know')
-            sent.merge_mwe('i_mean')
-            if len(sent.tokens) >= 2:
-                dep_txt.append(sent.to_str())
-        dep_txt = u'\n\n'.join(dep_txt)
-        conll.write(dep_txt)
-        pos.write(u'\n'.join(u' '.join('%s/%s' % (w.word, w.pos) for w in sent.tokens)
-                             for sent in sents if len(sent.tokens) >= 2))
-        txt.write(u'\n'.join(u' '.join(w.word for w in s.tokens) for s in sents
-                             if len(sent.tokens) >= 3))
-        conll.write(u'\n\n')
-        pos.write(u'\n')
-        txt.write(u'\n')
+    # Each file appears complete or not at all, and replaces the old one
+    with atomicOpen(out_dir.joinpath('%s.raw_conll' % name)) as raw, \
+            atomicOpen(out_dir.joinpath('%s.conll' % name)) as conll, \
+            atomicOpen(out_dir.joinpath('%s.pos' % name)) as pos, \
+            atomicOpen(out_dir.joinpath('%s.txt' % name)) as txt:
+        for raw_txt, conll_txt, pos_txt, txt_txt in results:
+            raw.write(raw_txt)
+            conll.write(conll_txt)
+            pos.write(pos_txt)
+            txt.write(txt_txt)
+
+
+def section_results(locs, cache=None, pool=None, batch_files=0, memo=None, workers=None,
+                    queue_size=0, build=None):
+    """Generate the (raw_conll, conll, pos, txt) text of each file in order,
+    processed here, by the workers process pool, or by a pipeline of
+    threads with queue_size batches queued between the stages. Files that
+    build has output for are only processed if they have changed"""
+    if build is not None:
+        return build.results(locs, lambda f: Path(f).parts[-1],
+                             lambda f: fileDigest(f, _get_dps_loc(f)),
+                             lambda stale: section_results(stale, cache, pool, batch_files, memo,
+                                                           workers, queue_size))
+    size = batch_files or 1
+    batches = [locs[i:i + size] for i in xrange(0, len(locs), size)]
+    if workers is None and queue_size:
+        batch_results = pipeline(({'files': batch} for batch in batches),
+                                 batch_stages(cache, pool, batch_files, memo), queue_size)
+    elif workers is None:
+        batch_results = (process_batch(batch, cache, pool, batch_files, memo)
+                         for batch in batches)
+    else:
+        # imap hands every batch out now, and gives the results back in order
+        batch_results = _tally(workers.imap(_process_in_worker, batches), memo)
+    return (texts for results in batch_results for texts in results)
+
+
+def batch_stages(cache=None, pool=None, batch_files=0, memo=None):
+    """The steps of processing a batch of files: reading, parsing, splitting
+    the trees, conversion and post-processing. Each takes the batch's dict
+    of work in progress and returns it, so they can be run one after the
+    other, or as the stages of a pipeline"""
+    def read(work):
+        work['mrg_txts'] = [read_mrg(f) for f in work['files']]
+        return work
+
+    def parse(work):
+        work['edits'] = [get_edited_yields(mrg_txt, cache=cache) for mrg_txt in work['mrg_txts']]
+        return work
+
+    def serialize(work):
+        work['trees'] = [split_trees(mrg_txt) for mrg_txt in work.pop('mrg_txts')]
+        return work
+
+    def convert(work):
+        if batch_files:
+            convert = lambda trees: convert_trees(trees, pool=pool, memo=memo)
+            work['dep_txts'] = convertGroups(work.pop('trees'), convert)
+        else:
+            work['dep_txts'] = [convert_trees(work.pop('trees')[0], pool=pool, memo=memo)]
+        return work
+
+    def post_process(work):
+        return [process_file(f, edits, dep_txt)
+                for f, edits, dep_txt in zip(work['files'], work['edits'], work['dep_txts'])]
+
+    return [read, parse, serialize, convert, post_process]
+
+
+def process_batch(batch, cache=None, pool=None, batch_files=0, memo=None):
+    work = {'files': batch}
+    for stage in batch_stages(cache, pool, batch_files, memo):
+        work = stage(work)
+    return work
+
+
+# Set up in each worker process by _start_worker
+_worker = {}
+
+
+def _start_worker(cache_dir, converters, stand_in, batch_tokens, timeout, batch_files, memo_loc):
+    _worker['cache'] = ParseCache(cache_dir) if cache_dir else None
+    _worker['pool'] = make_pool(converters, stand_in, batch_tokens, timeout)
+    _worker['memo'] = make_memo(memo_loc, stand_in)
+    _worker['batch_files'] = batch_files
+
+
+def _process_in_worker(batch):
+    memo = _worker['memo']
+    before = (memo.requested, memo.converted) if memo is not None else (0, 0)
+    results = process_batch(batch, _worker['cache'], _worker['pool'], _worker['batch_files'],
+                            memo)
+    after = (memo.requested, memo.converted) if memo is not None else (0, 0)
+    return results, (after[0] - before[0], after[1] - before[1])
+
+
+def _tally(worker_results, memo):
+    """Add the workers' memo counts to memo, for the report"""
+    for results, (requested, converted) in worker_results:
+        if memo is not None:
+            memo.requested += requested
+            memo.converted += converted
+        yield results
+
+
+def process_file(f, edits, dep_txt):
+    """Post-process a file's converter output, with the indices of the words
+    under EDITED nodes in each sentence, into its (raw_conll, conll, pos,
+    txt) text"""
+    raw_txt = dep_txt
+    # Now use sentence objects
+    sents = [Sentence(s) for s in dep_txt.strip().split('\n\n')]
+    dps_toks = _read_dps(_get_dps_loc(f))
+    dep_txt = []
+    assert len(sents) == len(edits)
+    tok_id = 0
+    for i, sent in enumerate(sents):
+        sent.add_edits(edits[i])
+        tok_id = sent.add_dps(tok_id, dps_toks)
+        sent.rm_tokens(lambda token: token.pos == '-DFL-')
+        sent.rm_tokens(lambda token: token.pos == 'XX')
+        sent.rm_tokens(lambda token: token.word[-1] == '-')
+        sent.rm_tokens(lambda token: token.pos in PUNCT)
+        sent.rm_tokens(lambda token: token.word.lower() in UHS)
+        sent.lower_case()
+        sent.merge_mwe('you_know')
+        sent.merge_mwe('i_mean')
+        if len(sent.tokens) >= 2:
+            dep_txt.append(sent.to_str())
+    dep_txt = u'\n\n'.join(dep_txt)
+    pos_txt = u'\n'.join(u' '.join('%s/%s' % (w.word, w.pos) for w in sent.tokens)
+                         for sent in sents if len(sent.tokens) >= 2)
+    # sent is the file's last sentence here, as it always has been
+    txt_txt = u'\n'.join(u' '.join(w.word for w in s.tokens) for s in sents
+                         if len(sent.tokens) >= 3)
+    return raw_txt, dep_txt + u'\n\n', pos_txt + u'\n', txt_txt + u'\n'
 
 
 def _get_dps_loc(mrg_loc):
@@ -343,12 +448,94 @@ def _read_dps(dps_loc):
     return toks
 
  
-def main(ptb_loc, out_dir):
-    train, test, dev, dev2 = divide_files(ptb_loc)
-    do_section(train, out_dir, 'train')
-    do_section(test, out_dir, 'test')
-    do_section(dev, out_dir, 'dev')
-    do_section(dev2, out_dir, 'dev2')
+def make_pool(converters, stand_in=False, batch_tokens=5000, timeout=600):
+    """Keep converters converter processes running, instead of starting a
+    JVM per file"""
+    if not converters:
+        return None
+    if stand_in:
+        command = standInCommand()
+    else:
+        command = javaCommand(STANFORD_BASIC, 'stanford_converter/', ['-mx800m'])
+    return ConverterPool(command, workers=converters, cwd='stanford_converter/',
+                         batchTokens=batch_tokens, timeout=timeout)
+
+
+def converter_id(stand_in=False):
+    if stand_in:
+        return 'stand-in'
+    return converterFingerprint(STANFORD_BASIC, 'stanford_converter/')
+
+
+def make_memo(memo_loc, stand_in=False):
+    """Keep the converter's output for each tree in an SQLite file, so
+    repeated trees are converted once"""
+    if not memo_loc:
+        return None
+    return ConversionCache(memo_loc, converter_id(stand_in))
+
+
+def make_build(build_dir, stand_in=False):
+    """Keep each file's output in build_dir, so reruns only process the
+    files that are new or changed, or were done by another converter or
+    version of this script"""
+    if not build_dir:
+        return None
+    return BuildManifest(build_dir, '%s\n%s' % (converter_id(stand_in), fileDigest(__file__)))
+
+
+@plac.annotations(
+    cache_dir=("Reuse tree parses from this directory", "option", "c", str),
+    converters=("Number of persistent converter processes (0 for a JVM per file)",
+                "option", "n", int),
+    batch_tokens=("Words per converter batch", "option", "b", int),
+    timeout=("Seconds before a converter batch is retried", "option", "t", float),
+    stand_in=("Use the Python stand-in converter, for testing", "flag", "s"),
+    batch_files=("Convert this many files per converter call (0 for one call per file)",
+                 "option", "f", int),
+    memo_loc=("Reuse conversions of identical trees from this SQLite file", "option", "m", str),
+    jobs=("Process files in this many worker processes, each with its own converters",
+          "option", "j", int),
+    queue_size=("Without -j, run reading, parsing, conversion, post-processing and writing "
+                "concurrently, with this many batches queued between them", "option", "q", int),
+    build_dir=("Keep each file's output in this directory, and on reruns only process "
+               "new or changed files", "option", "r", str),
+)
+def main(ptb_loc, out_dir, cache_dir=None, converters=0, batch_tokens=5000, timeout=600,
+         stand_in=False, batch_files=0, memo_loc=None, jobs=1, queue_size=0, build_dir=None):
+    cache = ParseCache(cache_dir) if cache_dir else None
+    memo = make_memo(memo_loc, stand_in)
+    build = make_build(build_dir, stand_in)
+    pool = None
+    workers = None
+    if jobs > 1:
+        workers = multiprocessing.Pool(jobs, _start_worker,
+                                       (cache_dir, converters, stand_in, batch_tokens, timeout,
+                                        batch_files, memo_loc))
+    else:
+        pool = make_pool(converters, stand_in, batch_tokens, timeout)
+    try:
+        train, test, dev, dev2 = divide_files(ptb_loc)
+        # With workers, every section's files are handed out before any is
+        # written, so the workers go on to the next section while the
+        # writer catches up
+        sections = [(name, section_results(locs, cache, pool, batch_files, memo, workers,
+                                           queue_size, build))
+                    for name, locs in [('train', train), ('test', test), ('dev', dev),
+                                       ('dev2', dev2)]]
+        for name, results in sections:
+            write_section(results, out_dir, name)
+    finally:
+        if workers is not None:
+            workers.terminate()
+        if pool is not None:
+            pool.close()
+        if memo is not None:
+            print >> sys.stderr, memo.report()
+            memo.close()
+        if build is not None:
+            print >> sys.stderr, build.report()
+            build.close()
 
 
 if __name__ == '__main__':
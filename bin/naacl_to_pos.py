@@ -32,19 +32,12 @@ def main(in_loc, ptb_loc):
         pos = pieces[1]
         tag = pieces[-1]
         dps_toks.append((word, pos, tag))
-    corpus = PennTreebank(path=ptb_loc)
-    # Index of sw4004
-    test_start = 496
-    # Index of sw4155
-    test_end = 548
-    # Dev start
-    dev_start = 598
-    dev_end = 650
+    corpus = PennTreebank(path=ptb_loc, lazy=True)
     i = 0
-    for file_idx in range(test_start, test_end):
-        file_ = corpus.child(file_idx)
-        for sent in file_.children():
-            if sent.child(0).label == 'CODE': continue
+    for file_ in corpus.splitFiles('test'):
+        for sent_idx in xrange(file_.length()):
+            if file_.topLabel(sent_idx) == 'CODE': continue
+            sent = file_.child(sent_idx)
             words = [w for w in sent.listWords() if not w.isPunct() and not
                      w.isTrace() and w.label not in markup and w.text[-1] != '-']
             if not words:
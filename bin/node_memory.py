@@ -0,0 +1,80 @@
+"""Report how much memory the parse tree nodes of each dialogue take.
+
+For every file, counts the nodes by class and measures them with
+sys.getsizeof, both as they are (slotted) and as the same objects would be
+with a per-instance __dict__ holding the same attributes.
+
+    python bin/node_memory.py nxt /usr/local/data/NXT-Switchboard/ -n 20
+    python bin/node_memory.py ptb /usr/local/data/Penn3/parsed/mrg/swbd/
+"""
+import sys
+from collections import defaultdict
+
+import plac
+from Treebank.PTB import PennTreebank, NXTSwitchboard
+
+
+class Unslotted(object):
+    """Stand-in for a node class without __slots__"""
+    pass
+
+
+def slot_names(node):
+    names = []
+    for cls in type(node).__mro__:
+        names.extend(cls.__dict__.get('__slots__', ()))
+    return names
+
+
+def unslotted_size(node):
+    twin = Unslotted()
+    for name in slot_names(node):
+        if hasattr(node, name):
+            setattr(twin, name, getattr(node, name))
+    return sys.getsizeof(twin) + sys.getsizeof(twin.__dict__)
+
+
+def measure(file_):
+    counts = defaultdict(int)
+    slotted = 0
+    unslotted = 0
+    for sent in file_.children():
+        for node in [sent] + sent.depthList():
+            counts[type(node).__name__] += 1
+            slotted += sys.getsizeof(node)
+            unslotted += unslotted_size(node)
+    return counts, slotted, unslotted
+
+
+@plac.annotations(
+    kind=("Corpus format", "positional", None, str, ['nxt', 'ptb']),
+    location=("Corpus root", "positional"),
+    n_files=("Only measure the first n files", "option", "n", int),
+)
+def main(kind, location, n_files=None):
+    corpus = NXTSwitchboard(path=location) if kind == 'nxt' else PennTreebank(path=location)
+    if n_files is None:
+        n_files = corpus.length()
+    totals = [0, 0, 0]
+    print '%-12s %8s %8s %8s %12s %12s %6s' % ('file', 'sents', 'nodes', 'leaves',
+                                              'slotted', 'unslotted', 'saved')
+    for i in xrange(n_files):
+        file_ = corpus.child(i)
+        counts, slotted, unslotted = measure(file_)
+        nodes = sum(counts.values())
+        leaves = counts['PTBLeaf']
+        totals[0] += nodes
+        totals[1] += slotted
+        totals[2] += unslotted
+        print '%-12s %8d %8d %8d %12d %12d %5.1f%%' % (file_.ID, file_.length(), nodes, leaves,
+            slotted, unslotted, 100.0 * (unslotted - slotted) / unslotted)
+    nodes, slotted, unslotted = totals
+    if nodes:
+        print '%-12s %8s %8d %8s %12d %12d %5.1f%%' % ('total', '', nodes, '', slotted, unslotted,
+            100.0 * (unslotted - slotted) / unslotted)
+        print 'bytes per node: %.1f slotted, %.1f unslotted' % (float(slotted) / nodes,
+                                                                 float(unslotted) / nodes)
+
+
+if __name__ == '__main__':
+    plac.call(main)
@@ -0,0 +1,40 @@
+"""Precompile NXT Switchboard dialogues into bundles.
+
+    python bin/nxt_bundle.py /usr/local/data/NXT-Switchboard/
+
+Writes <NXT root>/bundle/<file id>.bundle for each dialogue whose bundle
+is missing or older than its XML. NXTFile and NXTSwitchboard then load
+those dialogues from the bundle, without touching the XML. Pass -f to
+rebuild every bundle.
+"""
+import sys
+import time
+
+import plac
+from Treebank.PTB import NXTSwitchboard, NXTFile
+from Treebank.PTB._NXTBundle import isFresh
+
+
+@plac.annotations(
+    nxt_loc=("NXT Switchboard root", "positional"),
+    force=("Rebuild bundles that are up to date", "flag", "f"),
+)
+def main(nxt_loc, force=False):
+    corpus = NXTSwitchboard(path=nxt_loc, compact=True)
+    start = time.time()
+    n_built = 0
+    for file_id in corpus._children:
+        sources = NXTFile.sourcePaths(nxt_loc, file_id)
+        if not force and isFresh(nxt_loc, file_id, sources):
+            continue
+        # Read the XML even if a stale bundle is there
+        print >> sys.stderr, file_id
+        file_ = NXTFile(path=nxt_loc, filename=file_id, compact=True, bundle=False)
+        file_.saveBundle()
+        n_built += 1
+    print >> sys.stderr, '%d of %d dialogues bundled in %.1fs' % (
+        n_built, corpus.length(), time.time() - start)
+
+
+if __name__ == '__main__':
+    plac.call(main)
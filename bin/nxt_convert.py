@@ -1,12 +1,19 @@
 """Convert the Switchboard corpus via the NXT XML annotations, instead of the Treebank3
 format. The difference is that there's no issue of aligning the dps files etc."""
+import multiprocessing
 import os.path
+import sys
+from itertools import groupby, islice
+from operator import itemgetter
 from pathlib import Path
 
 import plac
-import fabric.api
 
 import Treebank.PTB
+from Treebank.PTB import EDITED, ParseCache
+from Treebank.Converter import ConverterPool, javaCommand, standInCommand, UNIVERSAL
+from Treebank.Converter import convertGroups, ConversionCache, converterFingerprint, runConverter
+from Treebank.Converter import pipeline, BuildManifest, atomicOpen, fileDigest
 
 
 def get_dfl(word, sent):
@@ -28,7 +35,7 @@ def speechify(sent):
 
 def remove_repairs(sent):
     for node in sent.depthList():
-        if node.label == 'EDITED':
+        if node.label is EDITED:
             node.prune()
 
 
@@ -58,27 +65,30 @@ def prune_empty(sent):
                 raise
 
 
-def convert_to_conllu(sents, name):
-    """Run the Stanford dependency converter over the mrg file, via the temp
-    files /tmp/*.mrg and /tmp/*.dep"""
+def tree_strings(sents):
     mrg_strs = []
     for sent in sents:
         if not sent.listWords():
             mrg_strs.append('(S (SYM -EMPTY-) )')
         else:
             mrg_strs.append(str(sent))
-    mrg_str = u'\n'.join(mrg_strs)
-    loc = '/tmp/%s.mrg' % name[:-4]
-    out_loc = '/tmp/%s.dep' % name[:-4] 
-    open(loc, 'w').write(mrg_str)
-    cmd = 'java -cp "./*:" -Dfile.encoding=UTF-8 ' \
-          'edu.stanford.nlp.trees.ud.UniversalDependenciesConverter ' \
-          '-encoding UTF-8 -treeFile {mrg_loc} > {out_loc}'
-    # Fabric just gives a nice context-manager for "cd" here
-    with fabric.api.lcd('stanford_converter/'):
-        # And a nice way to just run something --- I hate subprocess...
-        fabric.api.local(cmd.format(mrg_loc=loc, out_loc=out_loc))
-    return Path(out_loc).open().read()
+    return mrg_strs
+
+
+def convert_to_conllu(sents, name, pool=None, memo=None):
+    """Run the Stanford dependency converter over the mrg file, piping the
+    trees through it, or with the converters in pool. Trees in memo aren't
+    converted again"""
+    return convert_trees(tree_strings(sents), name, pool=pool, memo=memo)
+
+
+def convert_trees(mrg_strs, name, pool=None, memo=None):
+    if memo is not None:
+        return memo.convert(mrg_strs, lambda misses: convert_trees(misses, name, pool=pool))
+    if pool is not None:
+        return pool.convert(mrg_strs)
+    cmd = ['java', '-cp', './*:', '-Dfile.encoding=UTF-8'] + UNIVERSAL
+    return runConverter(cmd, mrg_strs, cwd='stanford_converter/')
 
 
 def transfer_heads(orig_words, sent, heads, labels, pos):
@@ -165,56 +175,212 @@ def enforce_single_root(tokens):
     return tokens
 
 
-def do_section(ptb_files, out_dir, name, turn):
+def read_dialogue(file_):
+    sents, orig_words = [], []
+    for sent in file_.children():
+        speechify(sent)
+        orig_words.append([(
+            w.wordID, w.text, w.label, get_dfl(w, sent), 
+            sent.speaker, sent.globalID, sent.turnID
+        ) for w in sent.listWords()])
+        # remove_repairs(sent)  # keep speech disfluencies!
+        # remove_fillers(sent)
+        # remove_prn(sent)
+        # prune_empty(sent)
+        sents.append(sent)
+    return sents, orig_words
+
+
+def do_section(ptb_files, out_dir, name, turn, pool=None, batch_files=0, memo=None):
+    write_section(section_results(ptb_files, name, pool, batch_files, memo), out_dir, name, turn)
+
+
+def write_section(results, out_dir, name, turn):
+    """Write each (doc_id, text) sentence, in order, to the split's file or,
+    with turn, to its dialogue's file. Files are replaced whole, so a
+    rerun doesn't add to them"""
     out_dir = Path(out_dir)
-    conllu = out_dir.joinpath('en_nxt-%s.conllu' % name).open('w')
     if turn and not Path(out_dir.joinpath(name)).exists():
         Path(out_dir.joinpath(name)).mkdir()
     # pos = out_dir.joinpath('en_nxt-%s.pos' % name).open('w')
     # txt = out_dir.joinpath('en_nxt-%s.txt' % name).open('w')
 
-    for file_ in ptb_files:
-        sents, orig_words = [], []
-        for sent in file_.children():
-            speechify(sent)
-            orig_words.append([(
-                w.wordID, w.text, w.label, get_dfl(w, sent), 
-                sent.speaker, sent.globalID, sent.turnID
-            ) for w in sent.listWords()])
-            # remove_repairs(sent)  # keep speech disfluencies!
-            # remove_fillers(sent)
-            # remove_prn(sent)
-            # prune_empty(sent)
-            sents.append(sent)
-        conllu_strs = convert_to_conllu(sents, file_.filename)
-        tok_id = 0
-        for i, conllu_sent in enumerate(conllu_strs.strip().split('\n\n')):
-            heads, labels, upos, xpos = read_conllu(conllu_sent)
-            tokens = transfer_heads(orig_words[i], sents[i], heads, labels, upos)
-
-            if not orig_words[i]:
-                continue
-
-            # TODO: recover untokenized surface forms for CoNLL-U text (see _PTBFile.py)
-            doc_id, sent_no = orig_words[i][0][5].split('~')
-            sent_id = '%s_%s' % (doc_id, sent_no)
-            turn_id = orig_words[i][0][6]
-            speaker_id = orig_words[i][0][4]
-            raw_text = ' '.join(["%s+%s+%s" % (tok[0], sent_id, i + 1) 
-                                 for i, tok in enumerate(tokens)])
-            
-            if turn:
-                # make sure files are empty before running (append mode is necessary)
-                conllu = out_dir.joinpath('%s/en_nxt_%s_%s.txt' % (name, name, doc_id)).open('a')
-            
-            conllu.write(u'# sent_id = %s_%s_%s\n' % (sent_id, turn_id, speaker_id))
-            # conllu.write(u'# turn_id = %s\n' % turn_id)
-            # conllu.write(u'# speaker = %s\n' % speaker_id)
-            # conllu.write(u'# addressee = %s\n' % ('B' if speaker_id == 'A' else 'A'))
-            conllu.write(u'# text = %s\n' % u''.join(raw_text))
-            conllu.write(u'%s\n\n' % format_sent(tokens, sent_id))
-            # pos.write(u'%s\n' % ' '.join('%s/%s' % (tok[0], tok[1]) for tok in tokens))
-            # txt.write(u'%s\n' % raw_text)
+    with atomicOpen(out_dir.joinpath('en_nxt-%s.conllu' % name)) as conllu:
+        if not turn:
+            for doc_id, text in results:
+                conllu.write(text)
+    if turn:
+        for doc_id, sentences in groupby(results, itemgetter(0)):
+            with atomicOpen(out_dir.joinpath('%s/en_nxt_%s_%s.txt' % (name, name, doc_id))) as conllu:
+                for doc_id, text in sentences:
+                    conllu.write(text)
+
+
+def results_by_id(file_ids, name, nxt_loc, cache=None, pool=None, batch_files=0, memo=None,
+                  workers=None, queue_size=0, build=None):
+    """Generate the (doc_id, text) of each output sentence of the dialogues
+    with file_ids, in order, loading them as they're processed, here or in
+    the workers. Dialogues that build has output for are only processed if
+    they have changed"""
+    def process(file_ids):
+        if workers is None:
+            ptb_files = (Treebank.PTB.NXTFile(path=nxt_loc, filename=file_id, cache=cache)
+                         for file_id in file_ids)
+        else:
+            ptb_files = file_ids
+        return dialogue_results(ptb_files, name, pool, batch_files, memo, workers, queue_size)
+
+    if build is None:
+        dialogues = process(file_ids)
+    else:
+        sources = lambda file_id: Treebank.PTB.NXTFile.sourcePaths(nxt_loc, file_id)
+        dialogues = build.results(file_ids, str, lambda file_id: fileDigest(*sources(file_id)),
+                                  process)
+    return (sentence for dialogue in dialogues for sentence in dialogue)
+
+
+def section_results(ptb_files, name, pool=None, batch_files=0, memo=None, workers=None,
+                    queue_size=0):
+    """Generate the (doc_id, text) of each output sentence in order"""
+    results = dialogue_results(ptb_files, name, pool, batch_files, memo, workers, queue_size)
+    return (sentence for dialogue in results for sentence in dialogue)
+
+
+def dialogue_results(ptb_files, name, pool=None, batch_files=0, memo=None, workers=None,
+                     queue_size=0):
+    """Generate the (doc_id, text) sentences of each dialogue in order.
+    Without workers, ptb_files are NXTFiles processed here, in turn or by a
+    pipeline of threads with queue_size batches queued between the stages;
+    with them, they are the file IDs of the dialogues for the worker
+    processes to load"""
+    batches = iter_batches(ptb_files, batch_files)
+    if workers is None and queue_size:
+        # Iterating over ptb_files loads the dialogues, in the first thread
+        batch_results = pipeline((start_work(batch) for batch in batches),
+                                 batch_stages(name, pool, batch_files, memo), queue_size)
+    elif workers is None:
+        batch_results = (process_batch(batch, name, pool, batch_files, memo)
+                         for batch in batches)
+    else:
+        # imap hands every batch out now, and gives the results back in order
+        batch_results = _tally(workers.imap(_process_in_worker,
+                                            [(batch, name) for batch in batches]), memo)
+    return (dialogue for results in batch_results for dialogue in results)
+
+
+def iter_batches(items, batch_files):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_files or 1))
+        if not batch:
+            return
+        yield batch
+
+
+def batch_stages(name, pool=None, batch_files=0, memo=None):
+    """The steps of processing a batch of loaded dialogues: cleaning the
+    trees, writing them out as strings, conversion and transferring the
+    heads back. Each takes the batch's dict of work in progress and returns
+    it, so they can be run one after the other, or as the stages of a
+    pipeline"""
+    def clean(work):
+        work['dialogues'] = [read_dialogue(file_) for file_ in work.pop('files')]
+        return work
+
+    def serialize(work):
+        work['trees'] = [tree_strings(sents) for sents, _ in work['dialogues']]
+        return work
+
+    def convert(work):
+        if batch_files:
+            convert = lambda trees: convert_trees(trees, name + '.mrg', pool=pool, memo=memo)
+            work['conllu_texts'] = convertGroups(work.pop('trees'), convert)
+        else:
+            work['conllu_texts'] = [convert_trees(work.pop('trees')[0], work['name'], pool=pool,
+                                                  memo=memo)]
+        return work
+
+    def transfer(work):
+        return [format_dialogue(sents, orig_words, conllu_strs)
+                for (sents, orig_words), conllu_strs in zip(work['dialogues'],
+                                                            work['conllu_texts'])]
+
+    return [clean, serialize, convert, transfer]
+
+
+def start_work(batch):
+    return {'files': batch, 'name': batch[0].filename}
+
+
+def process_batch(batch, name, pool=None, batch_files=0, memo=None):
+    work = start_work(batch)
+    for stage in batch_stages(name, pool, batch_files, memo):
+        work = stage(work)
+    return work
+
+
+# Set up in each worker process by _start_worker
+_worker = {}
+
+
+def _start_worker(nxt_loc, cache_dir, converters, stand_in, batch_tokens, timeout, batch_files,
+                  memo_loc):
+    _worker['nxt_loc'] = nxt_loc
+    _worker['cache'] = ParseCache(cache_dir) if cache_dir else None
+    _worker['pool'] = make_pool(converters, stand_in, batch_tokens, timeout)
+    _worker['memo'] = make_memo(memo_loc, stand_in)
+    _worker['batch_files'] = batch_files
+
+
+def _process_in_worker(args):
+    file_ids, name = args
+    batch = [Treebank.PTB.NXTFile(path=_worker['nxt_loc'], filename=file_id, cache=_worker['cache'])
+             for file_id in file_ids]
+    memo = _worker['memo']
+    before = (memo.requested, memo.converted) if memo is not None else (0, 0)
+    results = process_batch(batch, name, _worker['pool'], _worker['batch_files'], memo)
+    after = (memo.requested, memo.converted) if memo is not None else (0, 0)
+    return results, (after[0] - before[0], after[1] - before[1])
+
+
+def _tally(worker_results, memo):
+    """Add the workers' memo counts to memo, for the report"""
+    for results, (requested, converted) in worker_results:
+        if memo is not None:
+            memo.requested += requested
+            memo.converted += converted
+        yield results
+
+
+def format_dialogue(sents, orig_words, conllu_strs):
+    """The (doc_id, text) of each of a dialogue's output sentences"""
+    sentences = []
+    tok_id = 0
+    for i, conllu_sent in enumerate(conllu_strs.strip().split('\n\n')):
+        heads, labels, upos, xpos = read_conllu(conllu_sent)
+        tokens = transfer_heads(orig_words[i], sents[i], heads, labels, upos)
+
+        if not orig_words[i]:
+            continue
+
+        # TODO: recover untokenized surface forms for CoNLL-U text (see _PTBFile.py)
+        doc_id, sent_no = orig_words[i][0][5].split('~')
+        sent_id = '%s_%s' % (doc_id, sent_no)
+        turn_id = orig_words[i][0][6]
+        speaker_id = orig_words[i][0][4]
+        raw_text = ' '.join(["%s+%s+%s" % (tok[0], sent_id, i + 1) 
+                             for i, tok in enumerate(tokens)])
+        
+        text = u'# sent_id = %s_%s_%s\n' % (sent_id, turn_id, speaker_id)
+        # text += u'# turn_id = %s\n' % turn_id
+        # text += u'# speaker = %s\n' % speaker_id
+        # text += u'# addressee = %s\n' % ('B' if speaker_id == 'A' else 'A')
+        text += u'# text = %s\n' % u''.join(raw_text)
+        text += u'%s\n\n' % format_sent(tokens, sent_id)
+        # pos.write(u'%s\n' % ' '.join('%s/%s' % (tok[0], tok[1]) for tok in tokens))
+        # txt.write(u'%s\n' % raw_text)
+        sentences.append((doc_id, text))
+    return sentences
 
 
 def read_conllu(dep_txt):
@@ -249,14 +415,100 @@ def format_sent(tokens, sent_id):
     return u'\n'.join(lines)
 
 
-def main(nxt_loc, out_dir, turn=None):
+def make_pool(converters, stand_in=False, batch_tokens=5000, timeout=600):
+    """Keep converters converter processes running, instead of starting a
+    JVM per dialogue"""
+    if not converters:
+        return None
+    if stand_in:
+        command = standInCommand()
+    else:
+        command = javaCommand(UNIVERSAL, 'stanford_converter/', ['-Dfile.encoding=UTF-8'])
+    return ConverterPool(command, workers=converters, cwd='stanford_converter/',
+                         batchTokens=batch_tokens, timeout=timeout)
+
+
+def converter_id(stand_in=False):
+    if stand_in:
+        return 'stand-in'
+    return converterFingerprint(UNIVERSAL, 'stanford_converter/')
+
+
+def make_memo(memo_loc, stand_in=False):
+    """Keep the converter's output for each tree in an SQLite file, so
+    repeated trees are converted once"""
+    if not memo_loc:
+        return None
+    return ConversionCache(memo_loc, converter_id(stand_in))
+
+
+def make_build(build_dir, stand_in=False):
+    """Keep each dialogue's output in build_dir, so reruns only process the
+    dialogues that are new or changed, or were done by another converter
+    or version of this script"""
+    if not build_dir:
+        return None
+    return BuildManifest(build_dir, '%s\n%s' % (converter_id(stand_in), fileDigest(__file__)))
+
+
+@plac.annotations(
+    cache_dir=("Reuse dialogue parses from this directory", "option", "c", str),
+    converters=("Number of persistent converter processes (0 for a JVM per dialogue)",
+                "option", "n", int),
+    batch_tokens=("Words per converter batch", "option", "b", int),
+    timeout=("Seconds before a converter batch is retried", "option", "t", float),
+    stand_in=("Use the Python stand-in converter, for testing", "flag", "s"),
+    batch_files=("Convert this many dialogues per converter call (0 for one call each)",
+                 "option", "f", int),
+    memo_loc=("Reuse conversions of identical trees from this SQLite file", "option", "m", str),
+    jobs=("Process dialogues in this many worker processes, each with its own converters",
+          "option", "j", int),
+    queue_size=("Without -j, run loading, cleaning, conversion, head transfer and writing "
+                "concurrently, with this many batches queued between them", "option", "q", int),
+    build_dir=("Keep each dialogue's output in this directory, and on reruns only process "
+               "new or changed dialogues", "option", "r", str),
+)
+def main(nxt_loc, out_dir, turn=None, cache_dir=None, converters=0, batch_tokens=5000,
+         timeout=600, stand_in=False, batch_files=0, memo_loc=None, jobs=1, queue_size=0,
+         build_dir=None):
     if not os.path.exists("stanford_converter/"):
         os.makedirs("stanford_converter/")
-    corpus = Treebank.PTB.NXTSwitchboard(path=nxt_loc)
-    do_section(corpus.train_files(), out_dir, 'train', turn)
-    do_section(corpus.dev_files(), out_dir, 'dev', turn)
-    # do_section(corpus.dev2_files(), out_dir, 'dev2', turn)  # not needed
-    do_section(corpus.eval_files(), out_dir, 'test', turn)
+    cache = ParseCache(cache_dir) if cache_dir else None
+    corpus = Treebank.PTB.NXTSwitchboard(path=nxt_loc, parseCache=cache)
+    memo = make_memo(memo_loc, stand_in)
+    build = make_build(build_dir, stand_in)
+    pool = None
+    workers = None
+    if jobs > 1:
+        workers = multiprocessing.Pool(jobs, _start_worker,
+                                       (nxt_loc, cache_dir, converters, stand_in, batch_tokens,
+                                        timeout, batch_files, memo_loc))
+    else:
+        pool = make_pool(converters, stand_in, batch_tokens, timeout)
+    sections = [(name, [row.fileID for row in corpus.manifest.files(split)])
+                for name, split in [('train', 'train'), ('dev', 'dev'),
+                                    # ('dev2', 'dev2'),  # not needed
+                                    ('test', 'test')]]
+    try:
+        # With workers, every section's dialogues are handed out before any
+        # is written, so the workers go on to the next section while the
+        # writer catches up
+        sections = [(name, results_by_id(file_ids, name, nxt_loc, cache, pool, batch_files, memo,
+                                         workers, queue_size, build))
+                    for name, file_ids in sections]
+        for name, results in sections:
+            write_section(results, out_dir, name, turn)
+    finally:
+        if workers is not None:
+            workers.terminate()
+        if pool is not None:
+            pool.close()
+        if memo is not None:
+            print >> sys.stderr, memo.report()
+            memo.close()
+        if build is not None:
+            print >> sys.stderr, build.report()
+            build.close()
 
 
 if __name__ == '__main__':
@@ -3,7 +3,20 @@ Given .dep files make the train/dev/test split for SWBD
 """
 import plac
 from pathlib import Path
-from Treebank.PTB import PTBFile
+from Treebank.PTB import PTBFile, ParseCache, EDITED
+
+def preproc_split(fileID):
+    """The split this script has always used: narrower test and dev ranges
+    than the Johnson and Charniak ones, and no dev2"""
+    filenum = int(fileID[2:6])
+    if filenum < 4000:
+        return 'train'
+    elif 4004 <= filenum < 4153:
+        return 'test'
+    elif 4519 <= filenum < 4936:
+        return 'dev'
+    return None
+
 
 def convert_conll(conll_text):
     lines = []
@@ -15,8 +28,9 @@ def convert_conll(conll_text):
             lines.append((pieces[0], pieces[1], int(pieces[6]) - 1, pieces[7]))
     return '\n'.join(lines)
 
-def add_edits(deps, ptb_sents):
-    ptb_sents = [sent for sent in ptb_sents[1:] if sent.child(0).label != 'CODE']
+def add_edits(deps, ptb_file):
+    ptb_sents = [ptb_file.child(i) for i in xrange(1, ptb_file.length())
+                 if ptb_file.topLabel(i) != 'CODE']
     dep_sents = deps.strip().split('\n\n')
     assert len(dep_sents) == len(ptb_sents), '%d vs %d' % (len(dep_sents), len(ptb_sents))
     new_sents = []
@@ -25,7 +39,7 @@ def add_edits(deps, ptb_sents):
         nontrace = [w for w in ptb_sent.listWords() if not w.isTrace()]
         ids = dict((word, i) for i, word in enumerate(nontrace))
         for node in ptb_sent.depthList():
-            if node.label == 'EDITED':
+            if node.label is EDITED:
                 for word in node.listWords():
                     if word.isTrace(): continue
                     edits.add(ids[word])
@@ -39,33 +53,40 @@ def add_edits(deps, ptb_sents):
     return '\n\n'.join(new_sents) + '\n\n'
 
 
-def main(in_dir, out_dir):
+@plac.annotations(
+    cache_dir=("Reuse tree parses from this directory", "option", "c", str),
+)
+def main(in_dir, out_dir, cache_dir=None):
+    cache = ParseCache(cache_dir) if cache_dir else None
     in_dir = Path(in_dir)
     out_dir = Path(out_dir)
     train_file = out_dir.join('train.txt').open('w')
     dev_file = out_dir.join('devr.txt').open('w')
     test_file = out_dir.join('testr.txt').open('w')
+    out_files = {'train': train_file, 'dev': dev_file, 'test': test_file}
+    out_file = None
     ptb_loc = Path('/usr/local/data/Penn3/parsed/mrg/swbd/')
     for loc in in_dir:
         filename = loc.parts[-1]
         if not filename.endswith('dep'):
             continue
         filenum = int(filename[2:-8])
-        if filenum < 4000:
-            out_file = train_file
-        elif filenum >= 4004 and filenum < 4153:
-            out_file = test_file
-        elif filenum  >= 4519 and filenum < 4936:
-            out_file = dev_file
+        split = preproc_split(filename)
+        # A file outside the splits goes where the one before it went
+        if split is not None:
+            out_file = out_files[split]
+        elif out_file is None:
+            continue
         if filenum > 4000:
             section = '4'
         elif filenum > 3000:
             section = '3'
         else:
             section = '2'
-        ptb_file = PTBFile(path=str(ptb_loc.join(section).join(filename[:-4])))
+        ptb_file = PTBFile(path=str(ptb_loc.join(section).join(filename[:-4])), cache=cache,
+                           lazy=True)
         try:
-            with_edits = add_edits(loc.open().read(), list(ptb_file.children()))
+            with_edits = add_edits(loc.open().read(), ptb_file)
         except AssertionError:
             print "Skipping", loc
             continue
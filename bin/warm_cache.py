@@ -0,0 +1,33 @@
+"""Fill an on-disk parse cache for a whole corpus, so that later runs of the
+conversion scripts with the same cache directory skip parsing.
+
+    python bin/warm_cache.py nxt /usr/local/data/NXT-Switchboard/ ~/.cache/swbd_parses
+    python bin/warm_cache.py ptb /usr/local/data/Penn3/parsed/mrg/swbd/ ~/.cache/swbd_parses
+
+Files whose cached parse is still fresh are only read, not re-parsed.
+"""
+import sys
+import time
+
+import plac
+from Treebank.PTB import PennTreebank, NXTSwitchboard, ParseCache
+
+
+@plac.annotations(
+    kind=("Corpus format", "positional", None, str, ['nxt', 'ptb']),
+    location=("Corpus root", "positional"),
+    cache_dir=("Parse cache directory", "positional"),
+)
+def main(kind, location, cache_dir):
+    cache = ParseCache(cache_dir)
+    corpus_class = NXTSwitchboard if kind == 'nxt' else PennTreebank
+    corpus = corpus_class(path=location, parseCache=cache, compact=True)
+    start = time.time()
+    for file_ in corpus.children():
+        pass
+    print >> sys.stderr, '%d files in %.1fs: %d already cached, %d parsed' % (
+        corpus.length(), time.time() - start, cache.hits, cache.misses)
+
+
+if __name__ == '__main__':
+    plac.call(main)